@@ -0,0 +1,116 @@
+"""
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+This file is part of the collaboration between University of Modena and
+University of Campania "Luigi Vanvitelli". It is authored by Mattia Neroni and Marta Rinaldi.
+
+The scope is the implementation and validation of several algorithms to optimise the
+collection of milk and its delivery to the production plant or cheese factory.
+
+The problem is new in literature, and can be partially associated to the multi-source
+vehicle routing problem, with the only difference that the starting and ending depots
+are different like in the multi-source team orienteering problem.
+For a better description of the problem, please refer to scientific pubblication.
+
+
+Author: Mattia Neroni, Ph.D., Eng.
+Contact: mneroni@unimore.it
+Date: January 2022
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+"""
+import collections
+
+
+
+class RouteCache:
+    """
+    An instance of this class is a bounded LRU cache of routes, that keeps
+    the best known sequence of a set of nodes and its cost.
+
+    Routes made by the same vehicle, starting from the same source, and
+    delivering to the same depot the same nodes, share the same entry,
+    so the sequences found (e.g., optimised by the 2-OPT) in an iteration
+    of a multistart are used in the following ones.
+    """
+    def __init__(self, maxsize=4096):
+        """
+        Initialise.
+
+        :param maxsize: The maximum number of routes kept.
+
+        :attr entries: For each key (see key), the ids of the nodes in the best
+                        known order, its cost, and True if it has been optimised.
+        :attr hits: The number of lookups of known routes.
+        :attr misses: The number of lookups of unknown routes.
+        """
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def key (route):
+        """ The key of a route --i.e., vehicle, source, depot, and set of nodes. """
+        return (route.vehicle.id, route.source.id, route.depot.id, frozenset(n.id for n in route.nodes))
+
+    @property
+    def stats (self):
+        """ The hits, misses, and hit rate of the cache. """
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries),
+                "hit_rate": self.hits / lookups if lookups > 0 else 0.0}
+
+    def store (self, route, optimised=False):
+        """
+        This method keeps the sequence of a route if it is better than
+        the known one (or the same but now optimised).
+
+        :param route: The route.
+        :param optimised: True if the route has been optimised.
+        """
+        key = self.key(route)
+        entry = self.entries.get(key)
+        if entry is None or route.cost < entry[1] or (optimised and route.cost == entry[1]):
+            self.entries[key] = (tuple(n.id for n in route.nodes), route.cost, optimised)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def consult (self, route):
+        """
+        This method looks for a route in the cache. If a better sequence of its nodes
+        is known the route is updated, otherwise its sequence is stored.
+
+        :param route: The route.
+        :return: True if the route is now in a sequence already optimised, False otherwise.
+        """
+        key = self.key(route)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            self.store(route)
+            return False
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        ids, cost, optimised = entry
+        if cost <= route.cost:
+            nodes = {n.id: n for n in route.nodes}
+            route.nodes = collections.deque(nodes[i] for i in ids)
+            route.cost = cost
+            return optimised
+        self.store(route)
+        return False
+
+    def consult_all (self, routes):
+        """
+        This method consults the cache for all the routes of a solution.
+
+        :param routes: The routes.
+        :return: The overall cost of the routes (inf if there are no routes).
+        """
+        for route in routes:
+            self.consult(route)
+        return sum(r.cost for r in routes) if routes else float("inf")
@@ -0,0 +1,42 @@
+"""
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+This file is part of the collaboration between University of Modena and
+University of Campania "Luigi Vanvitelli". It is authored by Mattia Neroni and Marta Rinaldi.
+
+The scope is the implementation and validation of several algorithms to optimise the
+collection of milk and its delivery to the production plant or cheese factory.
+
+The problem is new in literature, and can be partially associated to the multi-source
+vehicle routing problem, with the only difference that the starting and ending depots
+are different like in the multi-source team orienteering problem.
+For a better description of the problem, please refer to scientific pubblication.
+
+
+Author: Mattia Neroni, Ph.D., Eng.
+Contact: mneroni@unimore.it
+Date: January 2022
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+"""
+import numpy as np
+
+
+
+class Context:
+    """
+    An instance of this class keeps the state of a single solve --i.e., the
+    attributes used by the heuristics while building a solution.
+
+    Keeping this state out of nodes and vehicles, the problem is never modified
+    by the heuristics, and it can be shared by solves running at the same time.
+    """
+    def __init__(self, problem):
+        """
+        Initialise.
+
+        :param problem: The problem to solve.
+
+        :attr assigned: For each node (by id), True if the node has been assigned to a vehicle.
+        :attr cnode: For each vehicle (by id), the id of the node where the vehicle is.
+        """
+        self.assigned = np.zeros(problem.n_nodes, dtype=bool)
+        self.cnode = np.full(problem.n_vehicles, -1, dtype=np.int64)
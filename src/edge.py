@@ -17,22 +17,68 @@ Contact: mneroni@unimore.it
 Date: January 2022
 %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
 """
+import numpy as np
 
-class Edge:
+
+
+class EdgeStore:
     """
-    An instance of this class represents an edge connecting two nodes to visit.
+    An instance of this class represents the edges connecting the nodes to visit
+    to each other, stored as parallel arrays (i.e., one position per edge) rather
+    than as one object per edge.
 
-    Only edges connecting nodes to visit to each other are instantiated.
+    Only edges connecting nodes to visit to each other are stored.
     We don't need edges connecting sources to nodes and nodes to depot.
     """
-    def __init__(self, inode, jnode, cost):
+    def __init__(self, inode, jnode, cost, savings):
         """
         Initialise.
-        :param inode: The starting node.
-        :param jnode: The ending node.
+        :param inode: The ids of the starting nodes.
+        :param jnode: The ids of the ending nodes.
         :param cost: The length of the path from inode to jnode.
+        :param savings: The savings of each edge for each source, with shape (n_sources, n_edges),
+                        so that the saving of the k-th edge for the s-th source is savings[s, k].
         """
         self.inode = inode
         self.jnode = jnode
         self.cost = cost
-        self.savings = dict()
+        self.savings = savings
+
+    @classmethod
+    def build (cls, nodes, dists, sources, depot):
+        """
+        Instantiate the edges connecting each pair of nodes to visit. Edges are
+        ordered by starting node and then by ending node, following the order
+        of the nodes provided.
+
+        The saving of the edge (i, j) for the source s is computed as
+        dists[s, j] + dists[i, depot] - dists[i, j], for the edges only.
+
+        :param nodes: The nodes to visit.
+        :param dists: The matrix of distances.
+        :param sources: The sources.
+        :param depot: The depot.
+        :return: The edges.
+        """
+        ids = np.fromiter((n.id for n in nodes), dtype=np.int64, count=len(nodes))
+        n = len(ids)
+        notloop = ~np.eye(n, dtype=bool).ravel()
+        inode = np.repeat(ids, n)[notloop]
+        jnode = np.tile(ids, n)[notloop]
+        cost = dists[inode, jnode]
+        from_sources = dists[[s.id for s in sources]][:, jnode]
+        savings = from_sources + dists[inode, depot.id][None, :] - cost[None, :]
+        return cls(inode, jnode, cost, savings)
+
+    def source_savings (self, source, edges=slice(None)):
+        """
+        The savings of (a subset of) the edges for a source.
+
+        :param source: The position of the source in problem.sources.
+        :param edges: The positions of the interested edges.
+        :return: The savings.
+        """
+        return self.savings[source][edges]
+
+    def __len__ (self):
+        return len(self.inode)
@@ -0,0 +1,100 @@
+"""
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+This file is part of the collaboration between University of Modena and
+University of Campania "Luigi Vanvitelli". It is authored by Mattia Neroni and Marta Rinaldi.
+
+The scope is the implementation and validation of several algorithms to optimise the
+collection of milk and its delivery to the production plant or cheese factory.
+
+The problem is new in literature, and can be partially associated to the multi-source
+vehicle routing problem, with the only difference that the starting and ending depots
+are different like in the multi-source team orienteering problem.
+For a better description of the problem, please refer to scientific pubblication.
+
+
+Author: Mattia Neroni, Ph.D., Eng.
+Contact: mneroni@unimore.it
+Date: January 2022
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+"""
+import os
+import random
+import argparse
+
+import utils
+import node
+import vehicle
+
+
+
+def generate (n_farms, *, n_sources=2, fleet=(1000, 1000), clusters=0, clustering=0.0, spread=5.0,
+              size=100.0, qty=(1, 10), Tmax=1000.0, seed=0, name=None):
+    """
+    This method generates a synthetic instance of the problem. Sources
+    and farms lie in a square with the depot in the middle. Farms are partly
+    uniformly distributed and partly grouped in clusters around random centres.
+
+    :param n_farms: The number of farms to visit.
+    :param n_sources: The number of sources.
+    :param fleet: The capacities of the vehicles starting from each source.
+    :param clusters: The number of clusters.
+    :param clustering: The share of farms in clusters (between 0 and 1).
+    :param spread: The standard deviation of the distance of farms from the centre of their cluster.
+    :param size: The side of the square.
+    :param qty: The minimum and maximum delivery quantity of a farm.
+    :param Tmax: The maximum length of a route.
+    :param seed: The seed of the random generator.
+    :param name: The name of the instance (by default it describes the instance).
+    :return: The problem instance.
+    """
+    rnd = random.Random(seed)
+    n_nodes = n_sources + n_farms + 1
+    n_clustered = round(n_farms * clustering) if clusters > 0 else 0
+    vehicle_ids = iter(range(n_sources * len(fleet)))
+
+    # Coordinates are rounded as they are exported
+    def point (x, y):
+        return round(min(max(x, 0.0), size), 1), round(min(max(y, 0.0), size), 1)
+
+    sources = tuple(
+        node.Node(i, *point(rnd.uniform(0, size), rnd.uniform(0, size)), 0, issource=True,
+                  vehicles=tuple(vehicle.Vehicle(next(vehicle_ids), capacity) for capacity in fleet))
+        for i in range(n_sources)
+    )
+
+    centres = [(rnd.uniform(0, size), rnd.uniform(0, size)) for _ in range(clusters)]
+    coordinates = []
+    for i in range(n_farms):
+        if i < n_clustered:
+            cx, cy = rnd.choice(centres)
+            coordinates.append(point(rnd.gauss(cx, spread), rnd.gauss(cy, spread)))
+        else:
+            coordinates.append(point(rnd.uniform(0, size), rnd.uniform(0, size)))
+    nodes = tuple(node.Node(i, x, y, rnd.randint(*qty)) for i, (x, y) in enumerate(coordinates, start=n_sources))
+
+    depot = node.Node(n_nodes - 1, *point(size / 2, size / 2), 0, isdepot=True)
+    name = name or f"g{n_farms}_{n_sources}_{len(fleet)}_{clusters}.txt"
+    return utils.Problem(name, n_nodes, n_sources * len(fleet), Tmax, sources, nodes, depot)
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Generate an instance in the format of the benchmarks.")
+    parser.add_argument("farms", type=int, help="The number of farms.")
+    parser.add_argument("--sources", type=int, default=2, help="The number of sources.")
+    parser.add_argument("--fleet", type=int, nargs="+", default=[1000, 1000], help="The capacities of the vehicles of each source.")
+    parser.add_argument("--clusters", type=int, default=0, help="The number of clusters.")
+    parser.add_argument("--clustering", type=float, default=0.0, help="The share of farms in clusters.")
+    parser.add_argument("--spread", type=float, default=5.0, help="The standard deviation of clusters.")
+    parser.add_argument("--tmax", type=float, default=1000.0, help="The maximum length of a route.")
+    parser.add_argument("--seed", type=int, default=0, help="The seed of the random generator.")
+    parser.add_argument("--name", default=None, help="The name of the file.")
+    parser.add_argument("--path", default="../tests/generated/", help="The directory where the instance is saved.")
+    args = parser.parse_args()
+
+    problem = generate(args.farms, n_sources=args.sources, fleet=tuple(args.fleet), clusters=args.clusters,
+                       clustering=args.clustering, spread=args.spread, Tmax=args.tmax, seed=args.seed, name=args.name)
+    os.makedirs(args.path, exist_ok=True)
+    utils.export(problem, args.path)
+    print(args.path + problem.name)
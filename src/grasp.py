@@ -20,23 +20,94 @@ Date: January 2022
 import math
 import random
 
+import numpy as np
 
-def GRASP (options, n=5):
+
+# The number of random indices drawn at once by the samplers
+BATCH = 1024
+
+# Up to this number of options, popping them from a list is faster than walking the tree
+SMALL = 16384
+
+
+
+class _Remaining:
+    """
+    An instance of this class keeps the options not selected yet. Their positions
+    are stored in a Fenwick tree, so that the k-th remaining option can be found
+    and removed in O(log n) (instead of the O(n) of list.pop).
+
+    Short lists of options are still popped directly, since moving a few
+    thousands of references is faster than walking the tree.
+    """
+    def __init__(self, options):
+        """
+        Initialise with all the options remaining.
+        :param options: The options.
+        """
+        self.options = list(options)
+        self.n = self.size = n = len(self.options)
+        self.tree = None
+        if n > SMALL:
+            i = np.arange(n + 1)
+            self.tree = (i & -i).tolist()
+            self.step = 1 << (n.bit_length() - 1)
+
+    def pop (self, k):
+        """
+        This method removes the k-th remaining option (starting from 0).
+        :param k: The rank of the option among the remaining ones.
+        :return: The option.
+        """
+        self.size -= 1
+        if self.tree is None:
+            return self.options.pop(k)
+
+        tree, n = self.tree, self.n
+        # Descend the tree looking for the position, and remove it from
+        # the nodes on the way that cover it
+        pos, rank, step = 0, k + 1, self.step
+        while step:
+            nxt = pos + step
+            if nxt <= n:
+                count = tree[nxt]
+                if count < rank:
+                    pos = nxt
+                    rank -= count
+                else:
+                    tree[nxt] = count - 1
+            step >>= 1
+        return self.options[pos]
+
+
+
+def _generator (rng):
+    """
+    The NumPy generator used by a sampler. When not provided, it is seeded
+    by the random module, so that random.seed keeps the samplers reproducible.
+    """
+    return rng if rng is not None else np.random.default_rng(random.getrandbits(64))
+
+
+
+def GRASP (options, n=5, *, rng=None):
     """
     This method carry out a GRASP selection over a set of options.
     :param otions: The possible options.
     :param n: The selection is made on first n options.
+    :param rng: The NumPy generator used (optional).
     :return: The selected option.
     """
-    L = len(options)
-    _options = list(options)
-    for _ in range(L):
-        idx = random.randint(0, min(n, len(_options) - 1))
-        yield _options.pop(idx)
+    remaining = _Remaining(options)
+    rng = _generator(rng)
+    while remaining.size > 0:
+        for u in rng.random(min(BATCH, remaining.size)).tolist():
+            idx = int(u * (min(n, remaining.size - 1) + 1))
+            yield remaining.pop(idx)
 
 
 
-def BRA (options, beta=0.3):
+def BRA (options, beta=0.3, *, rng=None):
     """
     This method carry out a biased-randomised selection. The selection is based
     on a quasi-geometric function:
@@ -47,21 +118,27 @@ def BRA (options, beta=0.3):
 
     :param options: The set of options already sorted from the best to the worst.
     :param beta: The parameter of the quasi-geometric distribution.
+    :param rng: The NumPy generator used (optional).
     :return: The element picked at each iteration.
     """
-    L = len(options)
-    _options = list(options)
-    for _ in range(L):
-        idx = int(math.log(random.random(), 1.0 - beta)) % len(_options)
-        yield _options.pop(idx)
+    remaining = _Remaining(options)
+    rng = _generator(rng)
+    while remaining.size > 0:
+        # NOTE: The number of failures before the first success is the index
+        # of the quasi-geometric distribution.
+        for idx in (rng.geometric(beta, min(BATCH, remaining.size)) - 1).tolist():
+            yield remaining.pop(idx % remaining.size)
 
 
 
-def single_BRA (options, beta=0.3):
+def single_BRA (options, beta=0.3, *, rng=None):
     """
     This method is a single iteration of the BRA.
+
+    :param rng: The NumPy generator used (optional, otherwise the random module).
     """
-    idx = int(math.log(random.random(), 1.0 - beta)) % len(_options)
+    u = random.random() if rng is None else rng.random()
+    idx = int(math.log(u, 1.0 - beta)) % len(options)
     return options[idx]
 
 
@@ -0,0 +1,202 @@
+"""
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+This file is part of the collaboration between University of Modena and
+University of Campania "Luigi Vanvitelli". It is authored by Mattia Neroni and Marta Rinaldi.
+
+The scope is the implementation and validation of several algorithms to optimise the
+collection of milk and its delivery to the production plant or cheese factory.
+
+The problem is new in literature, and can be partially associated to the multi-source
+vehicle routing problem, with the only difference that the starting and ending depots
+are different like in the multi-source team orienteering problem.
+For a better description of the problem, please refer to scientific pubblication.
+
+
+Author: Mattia Neroni, Ph.D., Eng.
+Contact: mneroni@unimore.it
+Date: January 2022
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+"""
+import collections
+import itertools
+import time
+
+import numpy as np
+
+
+class _Tour:
+    """
+    An instance of this class keeps a route as arrays during the inter-route
+    local search, together with its cached load and cumulative cost, so that
+    the capacity and the Tmax of any move can be checked in constant time.
+    """
+    def __init__(self, route, ids, dists, quantities):
+        """
+        Initialise.
+
+        :param route: The route.
+        :param ids: The ids of the nodes in the order in which they are visited,
+                    including the source and the depot.
+        :param dists: The matrix of distances.
+        :param quantities: The delivery quantity of each node (by id).
+
+        :attr cumcost: The cost of travelling the route up to each position.
+        :attr cumload: The quantity loaded by the first k nodes to visit.
+        """
+        self.route = route
+        self.capacity = route.vehicle.capacity
+        self.ids = ids = np.asarray(ids, dtype=np.int64)
+        self.cumcost = np.concatenate(([0.0], np.cumsum(dists[ids[:-1], ids[1:]])))
+        self.cumload = np.concatenate(([0], np.cumsum(quantities[ids[1:-1]])))
+
+    @property
+    def cost (self):
+        return self.cumcost[-1]
+
+    @property
+    def load (self):
+        return self.cumload[-1]
+
+    @property
+    def farms (self):
+        return self.ids[1:-1]
+
+
+
+def _relocate (t1, t2, dists, quantities, Tmax):
+    """
+    The best move of a node from the first route to the second one.
+
+    :return: The gain, the position of the node in the first route, and the position
+            after which it is inserted in the second route (None if there is no feasible move).
+    """
+    if len(t1.farms) == 0:
+        return 0.0, None
+    u, a, b = t1.ids[1:-1], t1.ids[:-2], t1.ids[2:]
+    x, y = t2.ids[:-1], t2.ids[1:]
+    removal = dists[a, u] + dists[u, b] - dists[a, b]
+    insertion = dists[x[None, :], u[:, None]] + dists[u[:, None], y[None, :]] - dists[x, y][None, :]
+    feasible = (
+        ((t2.load + quantities[u] <= t2.capacity) & (t1.cost - removal <= Tmax))[:, None]
+        & (t2.cost + insertion <= Tmax)
+    )
+    gain = np.where(feasible, removal[:, None] - insertion, -np.inf)
+    p, g = np.unravel_index(np.argmax(gain), gain.shape)
+    return gain[p, g], (p + 1, g)
+
+
+
+def _exchange (t1, t2, dists, quantities, Tmax):
+    """
+    The best exchange of a node of the first route with a node of the second one.
+
+    :return: The gain, and the positions of the nodes exchanged (None if there is no feasible move).
+    """
+    if len(t1.farms) == 0 or len(t2.farms) == 0:
+        return 0.0, None
+    u, a1, b1 = t1.ids[1:-1, None], t1.ids[:-2, None], t1.ids[2:, None]
+    v, a2, b2 = t2.ids[None, 1:-1], t2.ids[None, :-2], t2.ids[None, 2:]
+    cost1 = t1.cost - dists[a1, u] - dists[u, b1] + dists[a1, v] + dists[v, b1]
+    cost2 = t2.cost - dists[a2, v] - dists[v, b2] + dists[a2, u] + dists[u, b2]
+    qu, qv = quantities[u], quantities[v]
+    feasible = (
+        (t1.load - qu + qv <= t1.capacity) & (t2.load - qv + qu <= t2.capacity)
+        & (cost1 <= Tmax) & (cost2 <= Tmax)
+    )
+    gain = np.where(feasible, t1.cost + t2.cost - cost1 - cost2, -np.inf)
+    p, g = np.unravel_index(np.argmax(gain), gain.shape)
+    return gain[p, g], (p + 1, g + 1)
+
+
+
+def _two_opt_star (t1, t2, dists, quantities, Tmax):
+    """
+    The best exchange of the final parts of two routes (i.e., 2-opt* move).
+
+    :return: The gain, and the positions of the last nodes kept by the two routes
+            (None if there is no feasible move).
+    """
+    i, j = np.arange(len(t1.ids) - 1)[:, None], np.arange(len(t2.ids) - 1)[None, :]
+    ids1, ids2 = t1.ids, t2.ids
+    cost1 = t1.cumcost[i] + dists[ids1[i], ids2[j + 1]] + (t2.cost - t2.cumcost[j + 1])
+    cost2 = t2.cumcost[j] + dists[ids2[j], ids1[i + 1]] + (t1.cost - t1.cumcost[i + 1])
+    load1 = t1.cumload[i] + (t2.load - t2.cumload[j])
+    load2 = t2.cumload[j] + (t1.load - t1.cumload[i])
+    feasible = (load1 <= t1.capacity) & (load2 <= t2.capacity) & (cost1 <= Tmax) & (cost2 <= Tmax)
+    gain = np.where(feasible, t1.cost + t2.cost - cost1 - cost2, -np.inf)
+    p, g = np.unravel_index(np.argmax(gain), gain.shape)
+    return gain[p, g], (p, g)
+
+
+
+def _apply (move, position, t1, t2):
+    """
+    This method makes a move.
+
+    :return: The new sequences of ids of the two routes.
+    """
+    ids1, ids2 = t1.ids.tolist(), t2.ids.tolist()
+    p, g = position
+    if move is _relocate:
+        u = ids1.pop(p)
+        ids2.insert(g + 1, u)
+    elif move is _exchange:
+        ids1[p], ids2[g] = ids2[g], ids1[p]
+    else:
+        ids1, ids2 = ids1[:p + 1] + ids2[g + 1:], ids2[:g + 1] + ids1[p + 1:]
+    return ids1, ids2
+
+
+
+def improve (problem, routes, maxtime=float("inf"), tolerance=1e-9):
+    """
+    This method is an inter-route local search, which moves nodes between
+    routes starting from the same source through relocate (i.e., a node
+    moved to another route), exchange (i.e., two nodes of different routes
+    swapped), and 2-opt* (i.e., the final parts of two routes swapped) moves.
+
+    Each route keeps its cumulative load and cost, so the capacity of vehicles
+    and the Tmax are checked in constant time, and all the moves between
+    two routes are evaluated at once. The best move between each pair of routes
+    is made as long as it improves the solution.
+
+    :param problem: The instance of the problem.
+    :param routes: The routes (e.g., made by pjs.heuristic or nearest_neighbour.heuristic).
+    :param maxtime: The maximum time the optimization can go on.
+    :param tolerance: The minimum improvement for a move to be made.
+    :return: The routes optimised and the overall respective cost.
+    """
+    # time control 
+    _start = time.time()
+
+    dists, quantities, Tmax = problem.dists, problem.quantities, problem.Tmax
+    nodes = {n.id: n for n in problem.iternodes()}
+    tours = [_Tour(r, [r.source.id, *(n.id for n in r.nodes), r.depot.id], dists, quantities) for r in routes]
+
+    # Only routes with the same source and depot can exchange nodes
+    groups = collections.defaultdict(list)
+    for tour in tours:
+        groups[tour.route.source.id, tour.route.depot.id].append(tour)
+
+    improved = True
+    while improved and time.time() - _start <= maxtime:
+        improved = False
+        for group in groups.values():
+            for t1, t2 in itertools.permutations(range(len(group)), 2):
+                t1, t2 = group[t1], group[t2]
+                moves = [(move, *move(t1, t2, dists, quantities, Tmax)) for move in (_relocate, _exchange, _two_opt_star)]
+                move, gain, position = max(moves, key=lambda m: m[1])
+                if gain > tolerance:
+                    ids1, ids2 = _apply(move, position, t1, t2)
+                    for k, ids in ((group.index(t1), ids1), (group.index(t2), ids2)):
+                        group[k] = _Tour(group[k].route, ids, dists, quantities)
+                    improved = True
+
+    # Update the routes
+    total_cost = 0
+    for tour in (t for group in groups.values() for t in group):
+        route = tour.route
+        route.nodes = collections.deque(nodes[i] for i in tour.farms.tolist())
+        route.qty, route.cost = int(tour.load), float(tour.cost)
+        total_cost += route.cost
+    return tuple(routes), total_cost
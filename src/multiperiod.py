@@ -0,0 +1,110 @@
+"""
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+This file is part of the collaboration between University of Modena and
+University of Campania "Luigi Vanvitelli". It is authored by Mattia Neroni and Marta Rinaldi.
+
+The scope is the implementation and validation of several algorithms to optimise the
+collection of milk and its delivery to the production plant or cheese factory.
+
+The problem is new in literature, and can be partially associated to the multi-source
+vehicle routing problem, with the only difference that the starting and ending depots
+are different like in the multi-source team orienteering problem.
+For a better description of the problem, please refer to scientific pubblication.
+
+
+Author: Mattia Neroni, Ph.D., Eng.
+Contact: mneroni@unimore.it
+Date: January 2022
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+"""
+import parallel
+import pjs
+import opt
+import utils
+
+
+
+def _read_quantities (filename, path, core):
+    """
+    This method reads the delivery quantities of a period.
+
+    :param filename: The file of delivery quantities.
+    :param path: The directory where the file is.
+    :param core: The problem of another period, whose nodes and fleet must be the same.
+    :return: The delivery quantity of each node (by id).
+    """
+    capacities = {s.id: "-".join(str(v.capacity) for v in s.vehicles) for s in core.sources}
+    with open(path + filename, 'r') as file:
+        header = [next(file).replace('\n', '').split(" ")[1] for _ in range(3)]
+        if (int(header[0]), int(header[1]), int(header[2])) != (core.n_nodes, core.n_vehicles, core.Tmax):
+            raise ValueError(f"{filename} has not the same nodes and fleet of {core.name}")
+
+        quantities = [0] * core.n_nodes
+        for i, line in enumerate(file):
+            node_info = line.replace('\n', '').split(' ')
+            quantities[i] = int(node_info[1])
+            if capacities.get(i, "") != (node_info[2] if len(node_info) > 2 else ""):
+                raise ValueError(f"{filename} has not the same nodes and fleet of {core.name}")
+    return quantities
+
+
+
+def read (filenames, path="../tests/casestudy/", *, cache=utils.CACHE):
+    """
+    This method reads the periods of a case study, where nodes, fleet, and distances
+    are always the same and only the delivery quantities change.
+
+    The first period is read as usual, and the data that do not depend on the quantities
+    (e.g., distances, edges, sorted savings, neighbours) are computed once for it and
+    shared by all the periods (see utils.Problem.with_quantities).
+
+    :param filenames: The files of delivery quantities of the periods.
+    :param path: The directory where the files and the json of arcs are.
+    :param cache: The directory of the compiled instances, relative to path (see utils.read_real_problem).
+    :return: The problem of each period.
+    """
+    core = utils.read_real_problem(filenames[0], path, cache=cache)
+    for attr in utils.Problem.SHARED:
+        getattr(core, attr)
+    return [core] + [core.with_quantities(f, _read_quantities(f, path, core)) for f in filenames[1:]]
+
+
+
+def _solve (core, name, quantities, seed, maxiter, maxtime):
+    """
+    The solution of a period: the savings based multistart and the 2-OPT
+    of the best solution found.
+
+    :return: The routes (see parallel.pack) and their cost.
+    """
+    problem = core if name == core.name else core.with_quantities(name, quantities)
+    with parallel.stream(seed):
+        _, routes, _ = pjs.multistart(problem, maxiter=maxiter)
+        routes, cost = opt.allOPT2(routes, problem.dists, maxtime=maxtime)
+    return parallel.pack(routes), cost
+
+
+
+def solve (problems, *, maxiter=1000, maxtime=300, workers=1, seed=None):
+    """
+    This method solves all the periods read by read.
+
+    Periods are solved back to back, or on a pool of processes which receive the
+    shared data of the periods instead of computing them again. The memory mapped
+    data of compiled instances (e.g., the distances) are not copied to the processes,
+    which map the same files, whatever the start method (see utils.Problem.__getstate__).
+    Each period has its
+    own random stream generated from the seed, so the solutions do not depend
+    on the number of workers.
+
+    :param problems: The problems of the periods (see read).
+    :param maxiter: The iterations of the multistart of each period.
+    :param maxtime: The maximum time of the 2-OPT of each route.
+    :param workers: The number of processes.
+    :param seed: The master seed of the random streams of periods.
+    :return: The routes and cost of each period.
+    """
+    core = problems[0]
+    tasks = [(p.name, p.quantities.tolist(), s, maxiter, maxtime) for p, s in zip(problems, parallel.seeds(seed, len(problems)))]
+    results = parallel.run(_solve, core, tasks, workers)
+    return [(parallel.unpack(problem, routes), cost) for problem, (routes, cost) in zip(problems, results)]
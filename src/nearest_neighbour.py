@@ -20,80 +20,132 @@ Date: January 2022
 import itertools
 import random
 
-from grasp import GRASP, BRA
+import parallel
+from context import Context
+from grasp import single_BRA
+from stats import timer
 from route import Route
 
 
 
 
-def _check_inclusion (problem, node, vehicle, route, dists):
+def _check_inclusion (problem, ids, vehicle, route, dists, cnode):
     """
-    This method is used to check if a node can be included in the route
+    This method is used to check which nodes can be included in the route
     assigned to certain vehicle.
 
     :param problem: The instance of the problem to solve.
-    :param node: The node.
+    :param ids: The ids of the nodes.
     :param vehicle: The vehicle.
     :param route: The route.
     :param dists: The matrix of distances.
-    :return: True if the insertion is possible, False otherwise.
+    :param cnode: The id of the node where the vehicle is.
+    :return: A boolean mask which is True for the nodes that can be included.
     """
-    if node.qty + route.qty > vehicle.capacity:
-        return False
+    return (
+        (problem.quantities[ids] + route.qty <= vehicle.capacity)
+        & (route.cost + dists[cnode, ids] + dists[ids, problem.depot.id] <= problem.Tmax)
+    )
 
-    if route.cost + dists[vehicle.cnode, node.id] + dists[node.id, problem.depot.id] > problem.Tmax:
-        return False
 
-    return True
 
 
+def _unassigned (neighbours, assigned, chunk=32):
+    """
+    This method scans the nodes sorted by distance from the current node,
+    lazily skipping the nodes already assigned. Nodes are scanned in chunks
+    of growing size.
+
+    :param neighbours: The ids of nodes sorted by distance.
+    :param assigned: The assignment of nodes (by id).
+    :param chunk: The size of the first chunk.
+    :return: An iterator over the ids of not assigned nodes, chunk by chunk.
+    """
+    i = 0
+    while i < len(neighbours):
+        ids = neighbours[i:i + chunk]
+        yield ids[~assigned[ids]]
+        i += chunk
+        chunk *= 2
+
 
 
-def _nearest_node (problem, vehicle, route, nodes, dists, *, bra=False, beta=0.3):
+
+def _nearest_node (problem, vehicle, route, nodes, dists, cnode, assigned, *, bra=False, beta=0.3, rng=None, stats=None):
     """
     This method returns the nearest node for a given vehicle.
+    Only the nodes that can be included in the route are considered.
 
     :param problem: The instance of the problem to solve.
     :param vehicle: The considered vehicle.
     :param route: The route the vehicle is taking care of.
-    :param nodes: The options.
+    :param nodes: The nodes to visit by id.
     :param dists: The matrix of distances.
+    :param cnode: The id of the node where the vehicle is.
+    :param assigned: The assignment of nodes (by id).
     :param bra: True if a biased randomisation is used.
     :param beta: The parameter of the quasi-geometric function in the biased randomisation.
+    :param rng: The NumPy generator used by the biased randomisation (optional, see grasp).
+    :param stats: The stats.Stats to fill in (if any).
     :return: The nearest node.
     """
-    cnode = vehicle.cnode
-    sorted_nodes = sorted(nodes, key=lambda i: dists[cnode, i.id])
+    neighbours = problem.neighbours[cnode]
 
     # Greedy selection
     if not bra:
-        for node in sorted_nodes:
-            if _check_inclusion(problem, node, vehicle, route, dists):
-                return node, True
+        for ids in _unassigned(neighbours, assigned):
+            if stats is not None:
+                stats.count("nearest_neighbour.nodes_checked", len(ids))
+            ids = ids[_check_inclusion(problem, ids, vehicle, route, dists, cnode)]
+            if len(ids) > 0:
+                return nodes[int(ids[0])], True
+        return None, False
 
     # BRA selection
-    for node in BRA(sorted_nodes, beta):
-        if _check_inclusion(problem, node, vehicle, route, dists):
-            return node, True
+    ids = neighbours[~assigned[neighbours]]
+    if stats is not None:
+        stats.count("nearest_neighbour.nodes_checked", len(ids))
+    ids = ids[_check_inclusion(problem, ids, vehicle, route, dists, cnode)]
+    if len(ids) > 0:
+        return nodes[int(single_BRA(ids, beta, rng=rng))], True
 
     return None, False
 
 
 
 
-def heuristic (problem, *, bra=False, beta=0.3):
+def heuristic (problem, *, bra=False, beta=0.3, rng=None, cache=None, stats=None):
     """
     This method is the heuristic implementation of the nearest neighbour algorithm.
 
     :param problem: The instance of the problem to solve.
     :param bra: True if the biased randomisation is introduced, False otherwise.
     :param beta: The parameter of the biased randomisation.
+    :param rng: The NumPy generator used by the biased randomisation (optional, see grasp).
+    :param cache: A cache.RouteCache whose best known sequences replace the ones built.
+    :param stats: The stats.Stats to fill in (if any).
     :return: The solution as a tuple of routes, and the total cost of the solution.
     """
+    with timer(stats, "nearest_neighbour"):
+        routes, total_cost = _heuristic(problem, bra, beta, rng, cache, stats)
+    if stats is not None:
+        stats.count("nearest_neighbour.calls")
+        stats.count("nearest_neighbour.visits", sum(len(r.nodes) for r in routes))
+    return routes, total_cost
+
+
+
+
+def _heuristic (problem, bra, beta, rng, cache, stats):
+    """ The nearest neighbour algorithm (see heuristic). """
     depot, dists, n_vehicles = problem.depot, problem.dists, problem.n_vehicles
     n_nodes = len(problem.nodes)
     Tmax = problem.Tmax
 
+    # Init the state of this solve
+    context = Context(problem)
+    cnode, assigned = context.cnode, context.assigned
+
     # Initialise the total cost of the solution
     total_cost = 0
 
@@ -101,50 +153,50 @@ def heuristic (problem, *, bra=False, beta=0.3):
     routes = [Route(source,depot,vehicle) for source in problem.sources for vehicle in source.vehicles]
 
     # Initialise the nodes to visit
-    nodes = list(problem.nodes)
+    nodes = {node.id: node for node in problem.nodes}
 
     for i, route in enumerate(itertools.islice(itertools.cycle(routes), n_nodes)):
         vehicle = route.vehicle
 
         if i < n_vehicles:
-            vehicle.cnode = route.source.id
+            cnode[vehicle.id] = route.source.id
 
-        node, done = _nearest_node(problem, vehicle, route, nodes, dists, bra=bra, beta=beta)
+        node, done = _nearest_node(problem, vehicle, route, nodes, dists, cnode[vehicle.id], assigned, bra=bra, beta=beta, rng=rng, stats=stats)
 
         if done:
             route.nodes.append(node)
             route.qty += node.qty
-            cost = dists[vehicle.cnode, node.id]
+            cost = dists[cnode[vehicle.id], node.id]
             route.cost += cost
             total_cost += cost
 
-            vehicle.cnode = node.id
-            node.assigned = True
-            nodes.remove(node)
+            cnode[vehicle.id] = node.id
+            assigned[node.id] = True
 
     # Update the cost of routes including the travel to the depot
     for route in routes:
         vehicle = route.vehicle
-        cost = dists[vehicle.cnode, depot.id]
+        cost = dists[cnode[vehicle.id], depot.id]
         route.cost += cost
         total_cost += cost
 
+    # Use the best known sequences of the routes
+    if cache is not None:
+        total_cost = cache.consult_all(routes)
+
     # Return the solution and the relative cost
     return tuple(routes), total_cost
 
 
 
 
-def multistart (problem, maxiter=1000, betarange=(0.1, 0.3)):
+def _search (problem, maxiter, betarange, cache=None, stats=None):
     """
-    This method is a multistart implementation of the nearest neighbour algorithm.
+    The iterations of the multistart.
 
-    :param maxiter: The number of solutions explored.
-    :param betarange: The range of the beta parameter for the biased randomisation.
-    :return: The solution as a tuple of routes, and the total cost of the solution.
+    :return: The best routes and cost found (None, inf if maxiter is 0).
     """
-    # Generate a starting greedy solution
-    routes, cost = heuristic(problem)
+    routes, cost = None, float("inf")
 
     betamin, betamax = betarange
 
@@ -153,11 +205,66 @@ def multistart (problem, maxiter=1000, betarange=(0.1, 0.3)):
         beta = random.uniform(betamin, betamax)
 
         # Generate a new solution from scratch using the GRASP randomisation
-        newroutes, newcost = heuristic(problem, bra=True, beta=beta)
+        newroutes, newcost = heuristic(problem, bra=True, beta=beta, cache=cache, stats=stats)
 
         # If the new solution is better, the best solution is updated
         if newcost < cost:
             routes, cost = newroutes, newcost
 
+    return routes, cost
+
+
+
+
+def _search_stream (problem, maxiter, seed, betarange):
+    """
+    The iterations of the multistart made by a worker on its own random stream.
+
+    :return: The best routes (see parallel.pack) and cost found.
+    """
+    with parallel.stream(seed):
+        routes, cost = _search(problem, maxiter, betarange)
+    return parallel.pack(routes or ()), cost
+
+
+
+
+def multistart (problem, maxiter=1000, betarange=(0.1, 0.3), *, workers=1, seed=None, cache=None, stats=None):
+    """
+    This method is a multistart implementation of the nearest neighbour algorithm.
+
+    When more workers are used, iterations are split among a pool of processes,
+    each of them with an independent random stream generated from the master
+    seed. The result only depends on the seed and the number of workers.
+
+    :param maxiter: The number of solutions explored.
+    :param betarange: The range of the beta parameter for the biased randomisation.
+    :param workers: The number of processes.
+    :param seed: The master seed of the random streams of workers. If workers are 1 and
+                no seed is provided, the global random generator is used as it is.
+    :param cache: A cache.RouteCache consulted by the heuristic (by the best solutions
+                of workers if more workers are used).
+    :param stats: The stats.Stats to fill in (if any). The iterations made by other
+                processes are not counted.
+    :return: The solution as a tuple of routes, and the total cost of the solution.
+    """
+    # Generate a starting greedy solution
+    routes, cost = heuristic(problem, cache=cache, stats=stats)
+
+    # Explore the solutions
+    if workers == 1 and seed is None:
+        results = [_search(problem, maxiter, betarange, cache, stats)]
+    else:
+        tasks = [(n, s, betarange) for n, s in zip(parallel.split(maxiter, workers), parallel.seeds(seed, workers))]
+        results = [(parallel.unpack(problem, newroutes), newcost)
+                   for newroutes, newcost in parallel.run(_search_stream, problem, tasks, workers)]
+        if cache is not None:
+            results = [(newroutes, cache.consult_all(newroutes)) for newroutes, newcost in results]
+
+    # If a new solution is better, the best solution is updated
+    for newroutes, newcost in results:
+        if newcost < cost:
+            routes, cost = newroutes, newcost
+
     # Return the best solution found so far
     return routes, cost
@@ -45,14 +45,6 @@ class Node:
         self.issource = issource
         self.isdepot = isdepot
 
-        # Attributes used by savings based heuristic
-        self.assigned = False
-        self.from_source = 0
-        self.to_depot = 0
-        self.route = None
-        self.link_left = False
-        self.link_right = False
-
     @property
     def n_vehicles (self):
         return len(self.vehicles)
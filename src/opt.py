@@ -17,9 +17,20 @@ Contact: mneroni@unimore.it
 Date: January 2022
 %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
 """
+import bisect
 import collections
+import itertools
 import time 
 
+import numpy as np
+
+import parallel
+from stats import timer
+
+
+# Routes with less farms than this are solved exactly by allOPT2 (see HeldKarp)
+EXACT_SIZE = 13
+
 
 def _get_cost (route, solution, dists):
     """
@@ -40,81 +51,657 @@ def _get_cost (route, solution, dists):
     return cost
 
 
-def _fast_get_cost (swap, route, solution, current_cost, dists):
+def _fast_get_costs (tour, i, current_cost, dists):
     """
-    Fastest way to get the cost of a solution after a 2-opt swap.
+    Fastest way to get the cost of the solutions after all the 2-opt swaps
+    of the position i (i.e., the swaps (i, j) for j > i + 1).
     NOTE: This works only if the matrix of distances is symmetric.
 
-    :param swap: The ids of positions swapped.
-    :param route: The route to optimize.
-    :param solution: The nodes in the order in which they are visited.
+    :param tour: The ids of the nodes in the order in which they are visited, 
+                including the source and the depot.
+    :param i: The first position swapped.
     :param current_cost: The cost of the current solution.
     :param dists: The matrix of distances.
-    :return: The cost after swapping the positions indicated in swap.
+    :return: The cost after each swap, where the k-th one is the swap (i, i + 2 + k).
     """
-    sol = [route.source] + solution + [route.depot]
-    i, j = swap
-    A, B, C, D = sol[i].id, sol[i + 1].id, sol[j].id, sol[j + 1].id
+    A, B = tour[i], tour[i + 1]
+    C, D = tour[i + 2:-1], tour[i + 3:]
     return current_cost - dists[A, B] - dists[C, D] + dists[A, C] + dists[B, D]
 
 
-def OPT2 (route, dists, maxtime=float("inf")):
+def OPT2 (route, dists, maxtime=float("inf"), tolerance=1e-9, *, stats=None):
     """
     This method is an implementation of the 2-OPT algorithm.
 
+    The tour is swept position by position: the swaps of each position are
+    evaluated all together, and the best improving one is made before moving
+    to the next position. Sweeps are repeated until none of them improves the tour.
+
     :param route: The route made by a single vehicle on which the optimisation is made.
     :param dists: The matrix of distances between nodes.
     :param maxtime: The maximum time the optimization can go on.
+    :param tolerance: The minimum improvement for a swap to be made.
+    :param stats: The stats.Stats to fill in (if any).
     :return: The route optimised, and the new overall distance.
     """
+    nodes = {node.id: node for node in route.nodes}
+    tour = np.array([route.source.id, *nodes, route.depot.id])
+    with timer(stats, "opt"):
+        tour, cost = _opt2_tour(tour, route.cost, dists, maxtime, tolerance, stats)
+    route.nodes = collections.deque(nodes[n] for n in tour[1:-1].tolist())
+    route.cost = cost
+    return route, cost
+
+
+def _opt2_tour (tour, cost, dists, maxtime=float("inf"), tolerance=1e-9, stats=None):
+    """
+    The 2-OPT (see OPT2) made on the ids of the nodes of a route.
+
+    :param tour: The ids of the nodes in the order in which they are visited,
+                including source and depot. It is modified in place.
+    :param cost: The current cost of the tour.
+    :param dists: The matrix of distances between nodes.
+    :param maxtime: The maximum time the optimization can go on.
+    :param tolerance: The minimum improvement for a swap to be made.
+    :param stats: The stats.Stats to fill in (if any).
+    :return: The tour optimised, and the new overall distance.
+    """
     # time control 
     _start = time.time()
-    _ctime = time.time()
-
-    # useful variables
-    solution, cost = list(route.nodes), route.cost
-    L = len(solution)
-    i = 0
-    while i < L - 1:
-        j = i + 2
-        while j < L + 1:
-            #_new_solution = solution[:i] + list(reversed(solution[i:j])) + solution[j:]
-            #_new_cost =_get_cost(route, _new_solution, dists)
-            # No need to generate in this moment the new solution
-            new_cost = _fast_get_cost((i,j), route, solution, cost, dists)
-
-            if new_cost < cost:
-                solution = solution[:i] + list(reversed(solution[i:j])) + solution[j:]
-                cost = new_cost
-                i, j = 0, 1
-            
-            # If maxtime is exceeded set the condition to exit the optimization
-            _ctime = time.time()
-            if _ctime - _start > maxtime:
-                i, j = L, L 
-            
-            j += 1
-        i += 1
-
-    route.nodes = collections.deque(solution)
+
+    L = len(tour) - 2
+    evaluated, applied = 0, 0
+    improved = True
+    while improved and time.time() - _start <= maxtime:
+        improved = False
+        for i in range(L - 1):
+            new_costs = _fast_get_costs(tour, i, cost, dists)
+            best = int(np.argmin(new_costs))
+            evaluated += len(new_costs)
+
+            # NOTE: Without a tolerance, the noise of floats might keep
+            # making swaps that do not change the tour at all.
+            if new_costs[best] < cost - tolerance:
+                j = i + 2 + best
+                tour[i + 1:j + 1] = tour[i + 1:j + 1][::-1].copy()
+                cost = new_costs[best]
+                applied += 1
+                improved = True
+
+            # If maxtime is exceeded exit the optimization
+            if time.time() - _start > maxtime:
+                break
+
+    if stats is not None:
+        stats.count("opt.moves_evaluated", evaluated)
+        stats.count("opt.moves_applied", applied)
+    return tour, cost
+
+
+def _prefix_costs (tour, dists):
+    """
+    The prefix sums of the costs of the tour travelled forward and backward.
+
+    :param tour: The ids of the nodes in the order in which they are visited.
+    :param dists: The matrix of distances.
+    :return: Two arrays F and R, where F[k] (R[k]) is the cost of travelling
+            the first k edges of the tour forward (backward).
+    """
+    forward = np.zeros(len(tour))
+    backward = np.zeros(len(tour))
+    np.cumsum(dists[tour[:-1], tour[1:]], out=forward[1:])
+    np.cumsum(dists[tour[1:], tour[:-1]], out=backward[1:])
+    return forward, backward
+
+
+def asymmetric_OPT2 (route, dists, maxtime=float("inf"), tolerance=1e-9, *, stats=None):
+    """
+    This method is an implementation of the 2-OPT algorithm that works
+    with asymmetric matrices of distances too.
+
+    A 2-opt swap reverses the segment of the tour between the positions
+    swapped, so, besides the two edges replaced, its cost changes from the cost of
+    travelling the segment forward to the cost of travelling it backward.
+    Both are obtained in O(1) from the prefix sums of the tour, which are only
+    updated (from the first position changed on) when a swap is made.
+
+    As in OPT2, the best swap of each position is made before moving to the
+    next position, and sweeps are repeated until none of them improves the tour.
+
+    :param route: The route made by a single vehicle on which the optimisation is made.
+    :param dists: The matrix of distances between nodes.
+    :param maxtime: The maximum time the optimization can go on.
+    :param tolerance: The minimum improvement for a swap to be made.
+    :param stats: The stats.Stats to fill in (if any).
+    :return: The route optimised, and the new overall distance.
+    """
+    nodes = {node.id: node for node in route.nodes}
+    tour = np.array([route.source.id, *nodes, route.depot.id])
+    with timer(stats, "opt"):
+        tour, cost = _asymmetric_opt2_tour(tour, route.cost, dists, maxtime, tolerance, stats)
+    route.nodes = collections.deque(nodes[n] for n in tour[1:-1].tolist())
     route.cost = cost
     return route, cost
 
 
-def allOPT2 (routes, dists, maxtime=float("inf")):
+def _asymmetric_opt2_tour (tour, cost, dists, maxtime=float("inf"), tolerance=1e-9, stats=None):
     """
-    A simpler way to make the 2-OPT optimization on all
-    the provided routes.
+    The asymmetric 2-OPT (see asymmetric_OPT2) made on the ids of the nodes of a route.
+
+    :param tour: The ids of the nodes in the order in which they are visited,
+                including source and depot. It is modified in place.
+    :param cost: The current cost of the tour.
+    :param dists: The matrix of distances between nodes.
+    :param maxtime: The maximum time the optimization can go on.
+    :param tolerance: The minimum improvement for a swap to be made.
+    :param stats: The stats.Stats to fill in (if any).
+    :return: The tour optimised, and the new overall distance.
+    """
+    # time control 
+    _start = time.time()
+
+    forward, backward = _prefix_costs(tour, dists)
+    L = len(tour) - 2
+    evaluated, applied = 0, 0
+    improved = True
+    while improved and time.time() - _start <= maxtime:
+        improved = False
+        for i in range(L - 1):
+            j = np.arange(i + 2, L + 1)
+            A, B, C, D = tour[i], tour[i + 1], tour[j], tour[j + 1]
+            new_costs = (
+                cost - dists[A, B] - dists[C, D] + dists[A, C] + dists[B, D]
+                - (forward[j] - forward[i + 1]) + (backward[j] - backward[i + 1])
+            )
+            best = int(np.argmin(new_costs))
+            evaluated += len(new_costs)
+
+            if new_costs[best] < cost - tolerance:
+                j = j[best]
+                tour[i + 1:j + 1] = tour[i + 1:j + 1][::-1].copy()
+                # Prefix sums up to the position i do not change
+                np.cumsum(dists[tour[i:-1], tour[i + 1:]], out=forward[i + 1:])
+                np.cumsum(dists[tour[i + 1:], tour[i:-1]], out=backward[i + 1:])
+                forward[i + 1:] += forward[i]
+                backward[i + 1:] += backward[i]
+                cost = new_costs[best]
+                applied += 1
+                improved = True
+
+            # If maxtime is exceeded exit the optimization
+            if time.time() - _start > maxtime:
+                break
+
+    if stats is not None:
+        stats.count("opt.moves_evaluated", evaluated)
+        stats.count("opt.moves_applied", applied)
+    return tour, cost
+
+
+def _tour_prefix_costs (tour, D):
+    """
+    Same as _prefix_costs, but for a tour and a matrix of distances made of lists.
+    """
+    steps = list(zip(tour[:-1], tour[1:]))
+    forward = [0, *itertools.accumulate(D[a][b] for a, b in steps)]
+    backward = [0, *itertools.accumulate(D[b][a] for a, b in steps)]
+    return forward, backward
+
+
+class _Block:
+    """
+    A block of consecutive nodes of a _BlockTour, with the prefix sums of the
+    costs of travelling its nodes forward and backward in the stored order.
+    When reversed, the nodes are in the opposite order in the tour.
+    """
+    __slots__ = ("nodes", "forward", "backward", "reversed", "order")
+
+    def __init__(self, nodes, D):
+        self.nodes = nodes
+        self.forward, self.backward = _tour_prefix_costs(nodes, D)
+        self.reversed = False
+        self.order = 0
+
+
+class _BlockTour:
+    """
+    An instance of this class is a tour stored as a 2-level list --i.e., a list of
+    blocks of about sqrt(n) consecutive nodes, each of them with a flag that says if
+    its nodes are reversed.
+
+    Reversing a segment of the tour only splits the blocks at its ends and reverses
+    the order (and the flags) of the blocks in between, so it takes O(sqrt(n)).
+    Each block keeps the prefix sums of its own nodes, so only the blocks split
+    need them to be computed again, while the position of a node and the cost of
+    travelling the tour up to a position (forward or backward) take O(log n).
+    """
+    def __init__(self, tour, D):
+        """
+        Initialise.
+
+        :param tour: The nodes in the order in which they are visited (from 0 to n - 1).
+        :param D: The matrix of distances (as lists).
+        """
+        self.D = D
+        self.n = len(tour)
+        self.size = max(8, int(self.n ** 0.5))
+        self.where = [None] * self.n
+        self.index = [0] * self.n
+        self._build(tour)
+
+    def _build (self, tour):
+        """ This method splits the tour into blocks of the same size. """
+        self.blocks = [self._block(tour[k:k + self.size]) for k in range(0, len(tour), self.size)]
+        self._update()
+
+    def _block (self, nodes):
+        """ A new block with some nodes (in the stored order). """
+        block = _Block(nodes, self.D)
+        where, index = self.where, self.index
+        for k, node in enumerate(nodes):
+            where[node], index[node] = block, k
+        return block
+
+    def _update (self):
+        """
+        This method updates the position of each block, and the cost of travelling
+        the tour forward and backward up to the first node of each block.
+        """
+        D = self.D
+        self.offsets, self.to_block, self.from_block = [], [], []
+        offset, forward, backward, last = 0, 0, 0, None
+        for k, block in enumerate(self.blocks):
+            nodes = block.nodes
+            first = nodes[-1] if block.reversed else nodes[0]
+            if last is not None:
+                forward += D[last][first]
+                backward += D[first][last]
+            block.order = k
+            self.offsets.append(offset)
+            self.to_block.append(forward)
+            self.from_block.append(backward)
+            offset += len(nodes)
+            if block.reversed:
+                forward, backward = forward + block.backward[-1], backward + block.forward[-1]
+            else:
+                forward, backward = forward + block.forward[-1], backward + block.backward[-1]
+            last = nodes[0] if block.reversed else nodes[-1]
+
+    def tour (self):
+        """ The nodes in the order in which they are visited. """
+        return [n for block in self.blocks for n in (reversed(block.nodes) if block.reversed else block.nodes)]
+
+    def position (self, node):
+        """ The position of a node in the tour. """
+        block, k = self.where[node], self.index[node]
+        return self.offsets[block.order] + (len(block.nodes) - 1 - k if block.reversed else k)
+
+    def _locate (self, position):
+        """ The block of a position, and the position in the stored order of the block. """
+        b = bisect.bisect_right(self.offsets, position) - 1
+        block = self.blocks[b]
+        k = position - self.offsets[b]
+        return b, block, (len(block.nodes) - 1 - k if block.reversed else k)
+
+    def at (self, position):
+        """ The node in a position of the tour. """
+        _, block, k = self._locate(position)
+        return block.nodes[k]
+
+    def forward (self, position):
+        """ The cost of travelling the tour forward from its first node to a position. """
+        b, block, k = self._locate(position)
+        if block.reversed:
+            return self.to_block[b] + block.backward[-1] - block.backward[k]
+        return self.to_block[b] + block.forward[k]
+
+    def backward (self, position):
+        """ The cost of travelling the tour backward from a position to its first node. """
+        b, block, k = self._locate(position)
+        if block.reversed:
+            return self.from_block[b] + block.forward[-1] - block.forward[k]
+        return self.from_block[b] + block.backward[k]
+
+    def _split (self, position):
+        """ This method splits the blocks so that one of them starts at a position. """
+        b = bisect.bisect_right(self.offsets, position) - 1
+        if self.offsets[b] == position:
+            return
+        block = self.blocks[b]
+        nodes = block.nodes[::-1] if block.reversed else block.nodes
+        k = position - self.offsets[b]
+        head, tail = self._block(nodes[:k]), self._block(nodes[k:])
+        self.blocks[b:b + 1] = head, tail
+        self.offsets.insert(b + 1, position)
+
+    def reverse (self, i, j):
+        """
+        This method reverses the segment of the tour between two positions.
+
+        :param i: The first position of the segment.
+        :param j: The last position of the segment.
+        """
+        if i >= j:
+            return
+        self._split(i)
+        if j + 1 < self.n:
+            self._split(j + 1)
+        first = bisect.bisect_right(self.offsets, i) - 1
+        last = bisect.bisect_right(self.offsets, j) - 1
+        segment = self.blocks[first:last + 1]
+        for block in segment:
+            block.reversed = not block.reversed
+        self.blocks[first:last + 1] = segment[::-1]
+
+        # Too many small blocks make the positions slower to find
+        if len(self.blocks) > 2 * self.n // self.size + 2:
+            self._build(self.tour())
+        else:
+            self._update()
+
+
+def _improving_move (a, tour, near, D, tolerance):
+    """
+    This method looks for an improving 2-opt or Or-opt move that
+    makes the node a adjacent to one of its neighbours.
+
+    :param a: The node.
+    :param tour: The tour (see _BlockTour).
+    :param near: The neighbours of each node.
+    :param D: The matrix of distances.
+    :param tolerance: The minimum improvement for a move to be made.
+    :return: The segments to reverse (in order) to make the move and the nodes
+            involved by the move, or None if there is no improving move.
+    """
+    p, last = tour.position(a), tour.n - 2
+    for c in near[a]:
+        q = tour.position(c)
+
+        # 2-opt making a -> c (when c comes after a) or c -> a (when c comes before a)
+        if q > p + 1 or q < p - 1:
+            i, j = (p, q) if q > p else (q - 1, p - 1)
+            A, B, C, E = tour.at(i), tour.at(i + 1), tour.at(j), tour.at(j + 1)
+            delta = (
+                D[A][C] + D[B][E] - D[A][B] - D[C][E]
+                - (tour.forward(j) - tour.forward(i + 1)) + (tour.backward(j) - tour.backward(i + 1))
+            )
+            if delta < -tolerance:
+                return ((i + 1, j),), (A, B, C, E)
+
+        # Or-opt moving the segment of 1, 2, or 3 nodes starting with a
+        for l in (1, 2, 3):
+            if p + l - 1 > last:
+                break
+            if p <= q < p + l:
+                continue
+            first, end = a, tour.at(p + l - 1)
+            prev, nxt = tour.at(p - 1), tour.at(p + l)
+            removal = D[prev][nxt] - D[prev][first] - D[end][nxt]
+
+            # Insert the segment between c and its successor (c -> a)
+            if q != p - 1:
+                y = tour.at(q + 1)
+                if removal + D[c][first] + D[end][y] - D[c][y] < -tolerance:
+                    # The segment and the nodes up to c (or from the successor of c)
+                    # swap places, reversing them all and then each of them
+                    if q > p:
+                        moves = ((p, q), (p, q - l), (q - l + 1, q))
+                    else:
+                        moves = ((q + 1, p + l - 1), (q + 1, q + l), (q + l + 1, p + l - 1))
+                    return moves, (prev, nxt, first, end, c, y)
+
+            # Insert the reversed segment between the predecessor of c and c (a -> c)
+            if q != p + l:
+                x = tour.at(q - 1)
+                reversal = (tour.backward(p + l - 1) - tour.backward(p)) - (tour.forward(p + l - 1) - tour.forward(p))
+                if removal + D[x][end] + D[first][c] - D[x][c] + reversal < -tolerance:
+                    if q > p:
+                        moves = ((p, q - 1), (p, q - l - 1))
+                    else:
+                        moves = ((q, p + l - 1), (q + l, p + l - 1))
+                    return moves, (prev, nxt, first, end, x, c)
+
+    return None
+
+
+def LS (route, dists, maxtime=float("inf"), neighbours=8, tolerance=1e-9):
+    """
+    This method is a local search made of 2-opt and Or-opt (i.e., moving a
+    segment of 1 to 3 nodes somewhere else) moves.
+
+    Only the moves making a node adjacent to one of its nearest neighbours
+    are evaluated, and each move is priced in O(log n) (also on asymmetric matrices)
+    using the prefix sums of the tour. The tour is kept as a 2-level list (see
+    _BlockTour), so that a move is made in O(sqrt(n)), reversing some segments.
+    Don't-look bits keep track of the nodes whose neighbourhood may still contain
+    an improving move: a node is checked again only when a move changes one of
+    the edges around it.
+
+    :param route: The route made by a single vehicle on which the optimisation is made.
+    :param dists: The matrix of distances between nodes.
+    :param maxtime: The maximum time the optimization can go on.
+    :param neighbours: The number of nearest neighbours considered for each node.
+    :param tolerance: The minimum improvement for a move to be made.
+    :return: The route optimised, and the new overall distance.
+    """
+    # time control 
+    _start = time.time()
+
+    # Work on the nodes of the route only: 0 is the source, the last one the depot
+    nodes = list(route.nodes)
+    m = len(nodes)
+    if m < 2:
+        return route, route.cost
+    ids = [route.source.id, *(n.id for n in nodes), route.depot.id]
+    sub = dists[np.ix_(ids, ids)]
+    D = sub.tolist()
+
+    # The nearest neighbours of each node
+    farms = sub[1:m + 1, 1:m + 1].astype(float)
+    np.fill_diagonal(farms, np.inf)
+    near = [[]] + (np.argsort(farms, axis=1, kind="stable")[:, :min(neighbours, m - 1)] + 1).tolist()
+
+    tour = _BlockTour(list(range(m + 2)), D)
+
+    # Don't-look bits: only the nodes in queue are checked
+    queue = collections.deque(range(1, m + 1))
+    active = [False] + [True] * m + [False]
+
+    while queue:
+        a = queue.popleft()
+        active[a] = False
+
+        move = _improving_move(a, tour, near, D, tolerance)
+        if move is not None:
+            segments, touched = move
+            for i, j in segments:
+                tour.reverse(i, j)
+            for n in (a, *touched):
+                if 0 < n <= m and not active[n]:
+                    active[n] = True
+                    queue.append(n)
+
+        # If maxtime is exceeded exit the optimization
+        if time.time() - _start > maxtime:
+            break
+
+    route.nodes = collections.deque(nodes[n - 1] for n in tour.tour()[1:-1])
+    route.cost = tour.forward(m + 1)
+    return route, route.cost
+
+
+def allLS (routes, dists, maxtime=float("inf"), neighbours=8):
+    """
+    A simpler way to make the local search (see LS) on all the provided routes.
 
     :param routes: The routes to optimize.
     :param dists: The matrix of distances. 
     :param maxtime: The maximum time the optimization can go on.
+    :param neighbours: The number of nearest neighbours considered for each node.
     :return: The optimised routes and the overall respective cost.
     """
     optimized_routes = [None] * len(routes)
     total_cost = 0
     for i, route in enumerate(routes):
-        oproute, cost = OPT2(route, dists, maxtime)
+        oproute, cost = LS(route, dists, maxtime, neighbours)
         optimized_routes[i] = oproute
         total_cost += cost
     return optimized_routes, total_cost
+
+
+def _held_karp (source, farms, depot, dists):
+    """
+    The Held-Karp dynamic programming for the shortest path that starts
+    from the source, visits all the farms, and ends at the depot.
+
+    cost[mask, j] is the cost of the shortest path starting from the source,
+    visiting the farms in mask (as bits), and ending at farm j. Masks with the
+    same number of farms are computed all together from the smaller ones.
+
+    :param source: The id of the source.
+    :param farms: The ids of the farms.
+    :param depot: The id of the depot.
+    :param dists: The matrix of distances.
+    :return: The ids of the farms in the optimal order.
+    """
+    k = len(farms)
+    farms = np.asarray(farms)
+    D = dists[np.ix_(farms, farms)]
+    bits = 1 << np.arange(k)
+    masks = np.arange(1 << k)
+    inside = (masks[:, None] & bits) > 0
+    size = inside.sum(axis=1)
+
+    cost = np.full((1 << k, k), np.inf)
+    parent = np.zeros((1 << k, k), dtype=np.int64)
+    cost[bits, np.arange(k)] = dists[source, farms]
+    for l in range(2, k + 1):
+        M = masks[size == l]
+        # candidates[m, i, j] is the cost of reaching farm i from farm j
+        candidates = cost[M[:, None] ^ bits] + D.T[None, :, :]
+        best = candidates.argmin(axis=2)
+        value = np.take_along_axis(candidates, best[..., None], axis=2)[..., 0]
+        value[~inside[M]] = np.inf
+        cost[M], parent[M] = value, best
+
+    # Go back from the last farm visited
+    mask = (1 << k) - 1
+    j = int(np.argmin(cost[mask] + dists[farms, depot]))
+    order = []
+    while mask:
+        order.append(farms[j])
+        mask, j = mask ^ (1 << j), int(parent[mask, j])
+    return order[::-1]
+
+
+
+def HeldKarp (route, dists, *, tours=None):
+    """
+    This method finds the optimal order of the nodes of a route through
+    the Held-Karp dynamic programming. It takes O(2^n n^2), so it should
+    only be used for short routes (see EXACT_SIZE).
+
+    If a dictionary of tours is provided, the optimal tours are kept in it by source,
+    depot, and set of nodes, so that the same nodes are not optimised twice.
+
+    :param route: The route made by a single vehicle on which the optimisation is made.
+    :param dists: The matrix of distances between nodes.
+    :param tours: The optimal tours already found on the same matrix of distances (filled in).
+    :return: The route optimised, and the new overall distance.
+    """
+    nodes = {node.id: node for node in route.nodes}
+    if len(nodes) < 2:
+        return route, route.cost
+
+    tours = {} if tours is None else tours
+    key = (route.source.id, route.depot.id, frozenset(nodes))
+    if key not in tours:
+        order = _held_karp(route.source.id, list(nodes), route.depot.id, dists)
+        tour = [route.source.id, *order, route.depot.id]
+        cost = 0
+        for i, j in zip(tour, tour[1:]):
+            cost += dists[i, j]
+        tours[key] = (tuple(order), cost)
+
+    order, cost = tours[key]
+    if cost < route.cost:
+        route.nodes = collections.deque(nodes[n] for n in order)
+        route.cost = cost
+    return route, route.cost
+
+
+
+def _optimise_tour (dists, symmetric, tour, cost, maxtime):
+    """ The 2-OPT of a tour (symmetric or asymmetric), that can be run by a worker process. """
+    if symmetric:
+        return _opt2_tour(tour, cost, dists, maxtime)
+    return _asymmetric_opt2_tour(tour, cost, dists, maxtime)
+
+
+def allOPT2 (routes, dists, maxtime=float("inf"), *, workers=1, exact_size=EXACT_SIZE, tours=None, cache=None, stats=None):
+    """
+    A simpler way to make the 2-OPT optimization on all
+    the provided routes. If the matrix of distances is not
+    symmetric, the asymmetric version of the 2-OPT is used.
+    Routes with less than exact_size nodes are solved exactly (see HeldKarp).
+
+    Routes are independent, so they can be optimised on a pool of processes.
+    In this case, the routes are sent to the workers as arrays of ids, and the
+    matrix of distances is shared through shared memory instead of being
+    pickled for each route.
+
+    If a cache is provided, the routes whose nodes have already been optimised
+    (e.g., in a previous iteration of a multistart) are not optimised again.
+
+    :param routes: The routes to optimize.
+    :param dists: The matrix of distances. 
+    :param maxtime: The maximum time the optimization of each route can go on.
+    :param workers: The number of processes.
+    :param exact_size: The number of nodes under which routes are solved exactly.
+    :param tours: The optimal tours already found on the same matrix of distances (see HeldKarp).
+                NOTE: Without it, the optimal tours are not kept across calls, so callers
+                optimising the same nodes more times (e.g., a multistart) should pass one.
+    :param cache: A cache.RouteCache with the sequences already optimised.
+    :param stats: The stats.Stats to fill in (if any). The moves made by other processes are not counted.
+    :return: The optimised routes and the overall respective cost.
+    """
+    symmetric = np.array_equal(dists, dists.T)
+    if workers == 1:
+        optimise = OPT2 if symmetric else asymmetric_OPT2
+        optimized_routes = [None] * len(routes)
+        total_cost = 0
+        for i, route in enumerate(routes):
+            if cache is not None and cache.consult(route):
+                oproute, cost = route, route.cost
+            elif len(route.nodes) < exact_size:
+                with timer(stats, "opt.exact"):
+                    oproute, cost = HeldKarp(route, dists, tours=tours)
+            else:
+                oproute, cost = optimise(route, dists, maxtime, stats=stats)
+            if cache is not None:
+                cache.store(oproute, optimised=True)
+            optimized_routes[i] = oproute
+            total_cost += cost
+        return optimized_routes, total_cost
+
+    # Short routes are solved here, the others are sent to the workers
+    long_routes = []
+    for route in routes:
+        if cache is not None and cache.consult(route):
+            continue
+        if len(route.nodes) < exact_size:
+            HeldKarp(route, dists, tours=tours)
+        else:
+            long_routes.append(route)
+    tasks = [(symmetric, np.array([r.source.id, *(n.id for n in r.nodes), r.depot.id], dtype=np.int32), r.cost, maxtime)
+             for r in long_routes]
+    for route, (tour, cost) in zip(long_routes, parallel.run_shared(_optimise_tour, dists, tasks, workers)):
+        nodes = {node.id: node for node in route.nodes}
+        route.nodes = collections.deque(nodes[n] for n in tour[1:-1].tolist())
+        route.cost = cost
+    total_cost = 0
+    for route in routes:
+        if cache is not None:
+            cache.store(route, optimised=True)
+        total_cost += route.cost
+    return list(routes), total_cost
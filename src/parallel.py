@@ -0,0 +1,190 @@
+"""
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+This file is part of the collaboration between University of Modena and
+University of Campania "Luigi Vanvitelli". It is authored by Mattia Neroni and Marta Rinaldi.
+
+The scope is the implementation and validation of several algorithms to optimise the
+collection of milk and its delivery to the production plant or cheese factory.
+
+The problem is new in literature, and can be partially associated to the multi-source
+vehicle routing problem, with the only difference that the starting and ending depots
+are different like in the multi-source team orienteering problem.
+For a better description of the problem, please refer to scientific pubblication.
+
+
+Author: Mattia Neroni, Ph.D., Eng.
+Contact: mneroni@unimore.it
+Date: January 2022
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+"""
+import concurrent.futures
+import contextlib
+import random
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from route import Route
+
+
+# The copy of the problem owned by each worker process
+_problem = None
+
+# The array shared with each worker process and its memory (see run_shared)
+_shared = None
+_memory = None
+
+
+
+def split (maxiter, workers):
+    """
+    This method splits a number of iterations among workers.
+
+    :param maxiter: The number of iterations.
+    :param workers: The number of workers.
+    :return: The number of iterations made by each worker.
+    """
+    return [maxiter // workers + (1 if i < maxiter % workers else 0) for i in range(workers)]
+
+
+
+def seeds (seed, workers):
+    """
+    This method generates an independent and reproducible random stream
+    for each worker starting from a master seed.
+
+    :param seed: The master seed (if None a random one is used).
+    :param workers: The number of workers.
+    :return: The seed of each worker.
+    """
+    return [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(workers)]
+
+
+
+@contextlib.contextmanager
+def stream (seed):
+    """
+    This context manager seeds the global random generator with the seed
+    of a worker, and restores its previous state at the exit, so that a
+    worker run in the process of the caller (i.e., with a single worker)
+    does not change the random state of the caller.
+
+    :param seed: The seed of the worker (see seeds).
+    """
+    state = random.getstate()
+    random.seed(seed)
+    try:
+        yield
+    finally:
+        random.setstate(state)
+
+
+
+def _init (problem):
+    """ Initialise a worker process with its own copy of the problem. """
+    global _problem
+    _problem = problem
+
+
+
+def _call (task):
+    """ Run a task in a worker process on its copy of the problem. """
+    function, args = task
+    return function(_problem, *args)
+
+
+
+def run (function, problem, tasks, workers):
+    """
+    This method runs some tasks on a pool of processes, each of them
+    owning a copy of the problem.
+
+    :param function: The function to run, which receives the problem followed by
+                    the arguments of the task. It must be defined at module level.
+    :param problem: The problem.
+    :param tasks: The arguments of each task.
+    :param workers: The number of processes (if 1 tasks are run in this process).
+    :return: The results of the tasks in the same order of the tasks.
+    """
+    if workers == 1:
+        return [function(problem, *args) for args in tasks]
+
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=_init, initargs=(problem,)) as pool:
+        return list(pool.map(_call, [(function, args) for args in tasks]))
+
+
+
+def _init_shared (name, shape, dtype):
+    """ Initialise a worker process attaching it to the shared array. """
+    global _shared, _memory
+    _memory = shared_memory.SharedMemory(name=name)
+    _shared = np.ndarray(shape, dtype=dtype, buffer=_memory.buf)
+    _shared.flags.writeable = False
+
+
+
+def _call_shared (task):
+    """ Run a task in a worker process on the shared array. """
+    function, args = task
+    return function(_shared, *args)
+
+
+
+def run_shared (function, array, tasks, workers):
+    """
+    This method runs some tasks on a pool of processes, which read the
+    same array (e.g., the matrix of distances) from shared memory, instead
+    of receiving a copy of it.
+
+    :param function: The function to run, which receives the array followed by
+                    the arguments of the task. It must be defined at module level.
+    :param array: The array.
+    :param tasks: The arguments of each task.
+    :param workers: The number of processes (if 1 tasks are run in this process).
+    :return: The results of the tasks in the same order of the tasks.
+    """
+    if workers == 1:
+        return [function(array, *args) for args in tasks]
+
+    memory = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    try:
+        np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)[...] = array
+        initargs = (memory.name, array.shape, array.dtype.str)
+        with concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_shared, initargs=initargs) as pool:
+            return list(pool.map(_call_shared, [(function, args) for args in tasks]))
+    finally:
+        memory.close()
+        memory.unlink()
+
+
+
+def pack (routes):
+    """
+    This method translates some routes into a compact representation
+    based on ids, that can be cheaply sent between processes.
+
+    :param routes: The routes.
+    :return: The compact representation of the routes.
+    """
+    return [(r.source.id, r.depot.id, r.vehicle.id, [n.id for n in r.nodes], r.qty, r.cost) for r in routes]
+
+
+
+def unpack (problem, packed):
+    """
+    This method rebuilds the routes made of the nodes and vehicles of the
+    problem from their compact representation.
+
+    :param problem: The problem.
+    :param packed: The compact representation of the routes (see pack).
+    :return: The routes.
+    """
+    nodes = {n.id: n for n in problem.iternodes()}
+    vehicles = {v.id: v for s in problem.sources for v in s.vehicles}
+    routes = []
+    for source, depot, vehicle, ids, qty, cost in packed:
+        route = Route(nodes[source], nodes[depot], vehicles[vehicle])
+        route.nodes.extend(nodes[i] for i in ids)
+        route.qty, route.cost = qty, cost
+        routes.append(route)
+    return tuple(routes)
@@ -17,88 +17,238 @@ Contact: mneroni@unimore.it
 Date: January 2022
 %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
 """
-import operator
 import numpy as np
-import collections
 import random
 import itertools
+import collections
 
 import grasp
+import parallel
+from context import Context
+from stats import timer
 from route import Route
 
 
-def _reset_assignment (node):
-    """
-    This method reset the assignment of a node to a certain vehicle.
-    """
-    node.assigned = False
-    return node
-
-
-def _selector (iterable):
+def _selector (iterable, assigned):
     """
     This is just a wrapper around an iterator that filter nodes
     to return only the not assigned ones.
-    :param iterable: An iterable set of nodes (i.e., (rate, node)).
+    :param iterable: An iterable set of nodes.
+    :param assigned: The assignment of nodes (by id).
     """
-    for _, node in iterable:
-        if not node.assigned:
+    for node in iterable:
+        if not assigned[node.id]:
             yield node
 
 
-def mapper (problem, *, bra=False, beta=0.3):
+def mapper (problem, *, bra=False, beta=0.3, rng=None, stats=None):
     """
     This method has the objective to assign each customer to a source / vehicle.
 
     :param problem: The instance of the problem to solve.
     :param bra: True if the biased randomisation is used, False otherwise.
     :param beta: The parameter of the quasi geometric distribution used in the biased randomisation.
+    :param rng: The NumPy generator used by the biased randomisation (optional, see grasp).
+    :param stats: The stats.Stats to fill in (if any).
     :return: A mapping that assign each each customer to a certain vehicle.
     """
-    dists = problem.dists
-    sources, nodes, depot = problem.sources, problem.nodes, problem.depot
+    with timer(stats, "mapper"):
+        mapping = _mapper(problem, bra, beta, rng)
+    if stats is not None:
+        stats.count("mapper.calls")
+        stats.count("mapper.assigned", int(mapping.sum()))
+    return mapping
+
+
+
+def _mapper (problem, bra, beta, rng):
+    """ The mapping of customers to vehicles (see mapper). """
+    sources, nodes = problem.sources, problem.nodes
     vehicles = tuple(v for s in sources for v in s.vehicles)
     n_sources, n_nodes, n_vehicles = len(problem.sources), len(problem.nodes), len(vehicles)
 
-    # Reset the source the nodes belongs to
-    nodes = tuple(map(_reset_assignment, nodes))
+    # Init the state of this mapping
+    context = Context(problem)
+    assigned = context.assigned
 
-    # Compute the absolute distances
-    abs_dists = np.array(
-        [[dists[s.id, n.id] + dists[n.id, depot.id]
-          for n in nodes]
-         for s in sources for v in s.vehicles]
-    ).astype("float32")
-
-    # Compute the marginal distances
-    for i, vehicle in enumerate(vehicles):
-        marginal_dists = abs_dists[i, :] - np.concatenate((abs_dists[:i, :], abs_dists[i + 1:, :],), axis=0).min(axis=0)
-        vehicle.nodes = collections.deque()
+    # Nodes sorted by marginal distance for each vehicle
+    preferences = []
+    for sorted_nodes in problem.vehicle_preferences.tolist():
+        sorted_nodes = [nodes[i] for i in sorted_nodes]
         if not bra:
-            vehicle.preferences = _selector(iter(sorted(zip(marginal_dists, nodes), key=operator.itemgetter(0))))
+            preferences.append(_selector(iter(sorted_nodes), assigned))
         else:
-            vehicle.preferences = _selector(grasp.BRA(sorted(zip(marginal_dists, nodes), key=operator.itemgetter(0)), beta=beta))
+            preferences.append(_selector(grasp.BRA(sorted_nodes, beta=beta, rng=rng), assigned))
 
     # Init the assignment of customers to vehicles (i.e., mapping)
     mapping = np.zeros((n_vehicles, n_sources + n_nodes))
     # Until nodes are not concluded a vehicle at each turn pick a node
-    for vehicle in itertools.islice(itertools.cycle(vehicles), n_nodes):
+    for i in itertools.islice(itertools.cycle(range(n_vehicles)), n_nodes):
+        vehicle = vehicles[i]
         # Pick a node
-        picked_node = next(vehicle.preferences, None)
+        picked_node = next(preferences[i], None)
         # If the generator is exhausted exit the loop
         # NOTE: We should never reach this point
         if picked_node is None:
             break
         # Assign the node to the vehicle
-        vehicle.nodes.append(picked_node)
-        picked_node.assigned = True
+        assigned[picked_node.id] = True
         mapping[vehicle.id, picked_node.id] = 1
     # return the mapping
     return mapping
 
 
 
-def heuristic (problem, mapping, *, bra=False, beta=0.3):
+class _MergeEngine:
+    """
+    An instance of this class keeps the routes of a single source during the
+    merging process of the savings based heuristic.
+
+    Routes are stored into arrays, and each route is identified by the position
+    (i.e., slot) of the dummy route it originates from. Since a merge always
+    connects the last node of a route to the first node of another one, the
+    routes are kept as linked lists of nodes, and only their first and last
+    nodes need to know the route they belong to. In this way, both checking
+    and carrying out a merge are O(1).
+    """
+    def __init__(self, source, depot, vehicles, nodes, dists):
+        """
+        Initialise the dummy solution, made by one route for each node.
+
+        :param source: The source.
+        :param depot: The depot.
+        :param vehicles: The vehicles starting from the source.
+        :param nodes: For each vehicle, the nodes assigned to it.
+        :param dists: The matrix of distances.
+        """
+        self.source, self.depot = source, depot
+        self.vehicles = vehicles
+        self.nodes = tuple(node for vnodes in nodes for node in vnodes)
+        ids = np.array([node.id for node in self.nodes], dtype=np.int64)
+        n = len(ids)
+
+        # Nodes attributes
+        self.from_source = dists[source.id, ids]
+        self.to_depot = dists[ids, depot.id]
+        self.link_left = np.ones(n, dtype=bool)
+        self.link_right = np.ones(n, dtype=bool)
+        self.next = np.full(n, -1, dtype=np.int64)
+        # NOTE: It is up to date only for the first and the last node of each route
+        self.route = np.arange(n)
+        # The slot each slot has been merged into, so that the route of any node
+        # can be found following them (see same_route)
+        self.parent = np.arange(n)
+
+        # Routes attributes
+        self.vehicle = np.repeat(np.arange(len(vehicles)), [len(vnodes) for vnodes in nodes])
+        self.capacity = np.array([v.capacity for v in vehicles])[self.vehicle]
+        self.copies = np.array([len(vnodes) for vnodes in nodes], dtype=np.int64)
+        self.qty = np.array([node.qty for node in self.nodes])
+        self.cost = self.from_source + self.to_depot
+        # NOTE: Merges only extend routes on their tail, so the first node of each
+        # route is always the node in the position of its slot
+        self.tail = np.arange(n)
+        self.alive = np.ones(n, dtype=bool)
+        self.n_routes = n
+
+    def merge (self, i, j, cost, Tmax):
+        """
+        This method tries to merge the route ending with the node in position i
+        with the route starting with the node in position j.
+
+        :param i: The position of the first node.
+        :param j: The position of the second node.
+        :param cost: The cost of the edge connecting the two nodes.
+        :param Tmax: The maximum length of routes.
+        :return: None if the routes have been merged, otherwise the reason why
+                they cannot be merged (i.e., "links", "same route", "copies", "capacity", "Tmax").
+                NOTE: Nodes in the same route but not at its ends give "links" (see same_route).
+        """
+        # First node must be linked to depot and second node to source
+        if not self.link_right[i] or not self.link_left[j]:
+            return "links"
+
+        # The edge must merge two different routes
+        iroute, jroute = self.route[i], self.route[j]
+        if iroute == jroute:
+            return "same route"
+
+        # The second vehicle should not be deleted
+        if self.copies[self.vehicle[jroute]] == 1:
+            return "copies"
+
+        # Check capacity of vehicles
+        qty, cost_ = self.qty, self.cost
+        if qty[iroute] + qty[jroute] > self.capacity[iroute]:
+            return "capacity"
+
+        # Check length of route
+        if cost_[iroute] + cost_[jroute] + cost - self.to_depot[i] - self.from_source[j] > Tmax:
+            return "Tmax"
+
+        # Merge the routes
+        qty[iroute] += qty[jroute]
+        cost_[iroute] += cost + cost_[jroute] - self.to_depot[i] - self.from_source[j]
+        self.next[i] = j
+        tail = self.tail[jroute]
+        self.tail[iroute] = tail
+        self.route[tail] = iroute
+        self.link_left[j] = False
+        self.link_right[i] = False
+        self.copies[self.vehicle[jroute]] -= 1
+        self.alive[jroute] = False
+        self.parent[jroute] = iroute
+        self.n_routes -= 1
+        return None
+
+    def _find (self, i):
+        """
+        The slot of the route the node in position i belongs to. The slots
+        followed are shortcut on the way (i.e., path halving), so that
+        looking for the route of any node is O(1) amortised.
+
+        :param i: The position of the node.
+        :return: The slot of its route.
+        """
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def same_route (self, i, j):
+        """
+        This method checks if two nodes are in the same route. It is only
+        used to tell apart the merges rejected for this reason (see _instrumented_merge).
+
+        :param i: The position of the first node.
+        :param j: The position of the second node.
+        :return: True if the nodes are in the same route, False otherwise.
+        """
+        return self._find(i) == self._find(j)
+
+
+
+    def routes (self):
+        """
+        The routes still existing, in the order of their slots.
+        """
+        routes = []
+        nxt, nodes, vehicles = self.next.tolist(), self.nodes, self.vehicles
+        alive = np.flatnonzero(self.alive)
+        for slot, v, qty, cost in zip(alive.tolist(), self.vehicle[alive].tolist(), self.qty[alive].tolist(), self.cost[alive].tolist()):
+            route = Route(self.source, self.depot, vehicles[v])
+            i = slot
+            while i != -1:
+                route.nodes.append(nodes[i])
+                i = nxt[i]
+            route.qty, route.cost = qty, cost
+            routes.append(route)
+        return routes
+
+
+
+def heuristic (problem, mapping, *, bra=False, beta=0.3, rng=None, cache=None, stats=None):
     """
     Implementation of a savings based heuristic inspired by the Clarke & Wright savings.
 
@@ -106,6 +256,9 @@ def heuristic (problem, mapping, *, bra=False, beta=0.3):
     :param mapping: The mapping obtained.
     :param bra: True if the biased randomisation is used, False otherwise.
     :param beta: The parameter of the quasi geometric distribution used in the biased randomisation.
+    :param rng: The NumPy generator used by the biased randomisation (optional, see grasp).
+    :param cache: A cache.RouteCache whose best known sequences replace the ones built.
+    :param stats: The stats.Stats to fill in (if any).
     :return: The routes and the overall distance made by vehicles.
     """
     depot, edges, dists = problem.depot, problem.edges, problem.dists
@@ -114,115 +267,73 @@ def heuristic (problem, mapping, *, bra=False, beta=0.3):
     # Init the total set of routes an the total cost
     all_routes, total_distance = [], 0
 
-    # For each source a kind of PJS algorithm is done
-    for source in sources:
+    # Position of each node into the merging engine of its source
+    position = np.full(problem.n_nodes, -1, dtype=np.int64)
 
-        # Initialise the set of routes starting from the considered source
-        # and the inteested customers assigned during the mapping process
-        routes, nodes = [], []
+    # The nodes assigned to each vehicle according to the mapping
+    ids = [node.id for node in problem.nodes]
+    assigned = [[problem.nodes[i] for i in np.flatnonzero(row).tolist()] for row in mapping[:, ids]]
 
-        n_vehicles = len(source.vehicles)
-        
+    # For each source a kind of PJS algorithm is done
+    for k, source in enumerate(sources):
 
-        # Initialise the dummy solution
-        for vehicle in source.vehicles:
-            vehicle.copies = 0
-            for node in vehicle.nodes:
-                route = Route(source, depot, vehicle)
-                route.nodes.append(node)
-                node.route = route
-                node.link_left = True
-                node.link_right = True
-                node.from_source = dists[source.id, node.id]
-                node.to_depot = dists[node.id, depot.id]
-                route.qty = node.qty
-                route.cost = node.from_source + node.to_depot
-                vehicle.copies += 1
-                nodes.append(node)
-                routes.append(route)
-
-        nodes = set(nodes)
-        # Sort edges that characterise
-        sorted_edges = sorted(
-            [edge for edge in problem.edges if edge.inode in nodes and edge.jnode in nodes],
-            key=lambda i: i.savings[source.id],
-            reverse=True
-        )
+        # Initialise the dummy solution with the customers assigned
+        # to the vehicles of the source during the mapping process
+        n_vehicles = len(source.vehicles)
+        engine = _MergeEngine(source, depot, source.vehicles, [assigned[v.id] for v in source.vehicles], dists)
+        position[:] = -1
+        position[[node.id for node in engine.nodes]] = np.arange(len(engine.nodes))
+
+        # Filter the sorted edges that characterise the nodes assigned to the source
+        with timer(stats, "savings.sort"):
+            order = problem.savings_order[k]
+            ipos, jpos = position[edges.inode[order]], position[edges.jnode[order]]
+            selected = (ipos >= 0) & (jpos >= 0)
+            ipos, jpos = ipos[selected].tolist(), jpos[selected].tolist()
+            costs = edges.cost[order[selected]].tolist()
 
         # Init edges iterator
-        edges_iterator = iter(sorted_edges) if not bra else grasp.BRA(sorted_edges, beta=beta)
+        edges_iterator = range(len(costs)) if not bra else grasp.BRA(range(len(costs)), beta=beta, rng=rng)
 
         # Merging process
-        for edge in edges_iterator:
-            # Extract interested nodes and routes
-            inode, jnode = edge.inode, edge.jnode
-            iroute, jroute = inode.route, jnode.route
-
-            # The edge must merge two different routes
-            if iroute == jroute:
-                continue
-
-            # The second vehicle should not be deleted
-            if jroute.vehicle.copies == 1:
-                continue
-
-            # First node must be linked to depot and second node to source
-            if not inode.link_right or not jnode.link_left:
-                continue
-
-            # Check capacity of vehicles
-            if iroute.qty + jroute.qty > iroute.vehicle.capacity:
-                continue
-
-            # Check length of route
-            if iroute.cost + jroute.cost + edge.cost - inode.to_depot - jnode.from_source > Tmax:
-                continue
-
-            # Merge the routes
-            iroute.qty += jroute.qty
-            iroute.cost += edge.cost + jroute.cost - inode.to_depot - jnode.from_source
-            iroute.nodes.extend(jroute.nodes)
-            jnode.link_left = False
-            inode.link_right = False
-            jroute.vehicle.copies -= 1
-            routes.remove(jroute)
-            for node in jroute.nodes:
-                node.route = iroute
-
-            # if the number of routes is equal to the number of vehicles exits the merging process
-            if len(routes) == n_vehicles:
-                break
+        with timer(stats, "savings.merge"):
+            if stats is None:
+                for e in edges_iterator:
+                    engine.merge(ipos[e], jpos[e], costs[e], Tmax)
+
+                    # if the number of routes is equal to the number of vehicles exits the merging process
+                    if engine.n_routes == n_vehicles:
+                        break
+            else:
+                _instrumented_merge(engine, edges_iterator, ipos, jpos, costs, Tmax, n_vehicles, stats)
         
         # update the total set of routes 
+        routes = engine.routes()
+        if cache is not None:
+            for route in routes:
+                cache.consult(route)
         all_routes.extend(routes)
         total_distance += sum(r.cost for r in routes)
 
+    if stats is not None:
+        stats.count("savings.calls")
+
     # return routes and their cost
     return tuple(all_routes), total_distance
 
 
 
-def multistart (problem, *, maxiter=1000, bra=(True, True), betarange = ((0.1, 0.3), (0.1, 0.3))):
+def _search (problem, maxiter, bra, betarange, cache=None, stats=None):
     """
-    This is a multistart implementatio on the savings based heuristic 
-    that makes use of biased randomisation.
-    It is possible to implement the BRA both in the mapping as in the 
-    savings-based heuristic.
-
-    :param problem: The problem to solve.
-    :param maxiter: The numebr of solutions explored.
-    :param bra: True if the biased randomisation is used, False otherwise.
-    :param betarange: The betaranges for the biased randomisation.
+    The iterations of the multistart.
 
-    :return: The mapping, the routes found, and the respective cost.
+    :return: The best mapping, routes, and cost found (None, None, inf if maxiter is 0).
     """
     # Move useful variables to the stack
     mapping_bra, pjs_bra = bra 
     mapping_range, pjs_range = betarange
 
-    # Initial greedy solution
-    bestmapping = mapper(problem)
-    bestroutes, bestcost = heuristic(problem, bestmapping)
+    bestmapping, bestroutes, bestcost = None, None, float("inf")
 
     for _ in range(maxiter):
 
@@ -231,13 +342,94 @@ def multistart (problem, *, maxiter=1000, bra=(True, True), betarange = ((0.1, 0
         betasavings = random.uniform(pjs_range[0], pjs_range[1])
 
         # Generate new solution
-        mapping = mapper(problem, bra=mapping_bra, beta=betamapper)
-        routes, cost = heuristic(problem, mapping, bra=pjs_bra, beta=betasavings)
+        mapping = mapper(problem, bra=mapping_bra, beta=betamapper, stats=stats)
+        routes, cost = heuristic(problem, mapping, bra=pjs_bra, beta=betasavings, cache=cache, stats=stats)
 
         # Eventually update best solution
         if cost < bestcost:
             bestmapping, bestroutes, bestcost = mapping, routes, cost
-    
+
     return bestmapping, bestroutes, bestcost
 
 
+
+def _search_stream (problem, maxiter, seed, bra, betarange):
+    """
+    The iterations of the multistart made by a worker on its own random stream.
+
+    :return: The best mapping, routes (see parallel.pack), and cost found.
+    """
+    with parallel.stream(seed):
+        mapping, routes, cost = _search(problem, maxiter, bra, betarange)
+    return mapping, parallel.pack(routes or ()), cost
+
+
+
+def _instrumented_merge (engine, edges_iterator, ipos, jpos, costs, Tmax, n_vehicles, stats):
+    """
+    The merging process of the heuristic that also counts the edges scanned,
+    and the merges made and rejected by reason. It is kept apart so that
+    the merging process does not pay for counting when stats are not required.
+    """
+    scanned, rejected = 0, collections.Counter()
+    for e in edges_iterator:
+        scanned += 1
+        reason = engine.merge(ipos[e], jpos[e], costs[e], Tmax)
+        # Edges between nodes of the same route are counted as such first
+        if reason == "links" and engine.same_route(ipos[e], jpos[e]):
+            reason = "same route"
+        rejected[reason] += 1
+        if engine.n_routes == n_vehicles:
+            break
+    stats.count("savings.edges_scanned", scanned)
+    stats.count("savings.merges", rejected.pop(None, 0))
+    for reason, n in rejected.items():
+        stats.count(f"savings.rejected.{reason}", n)
+
+
+
+def multistart (problem, *, maxiter=1000, bra=(True, True), betarange = ((0.1, 0.3), (0.1, 0.3)), workers=1, seed=None, cache=None, stats=None):
+    """
+    This is a multistart implementatio on the savings based heuristic 
+    that makes use of biased randomisation.
+    It is possible to implement the BRA both in the mapping as in the 
+    savings-based heuristic.
+
+    When more workers are used, iterations are split among a pool of processes,
+    each of them with an independent random stream generated from the master
+    seed. The result only depends on the seed and the number of workers.
+
+    :param problem: The problem to solve.
+    :param maxiter: The numebr of solutions explored.
+    :param bra: True if the biased randomisation is used, False otherwise.
+    :param betarange: The betaranges for the biased randomisation.
+    :param workers: The number of processes.
+    :param seed: The master seed of the random streams of workers. If workers are 1 and
+                no seed is provided, the global random generator is used as it is.
+    :param cache: A cache.RouteCache consulted by the heuristic (by the best solutions
+                of workers if more workers are used).
+    :param stats: The stats.Stats to fill in (if any). The iterations made by other
+                processes are not counted.
+
+    :return: The mapping, the routes found, and the respective cost.
+    """
+    # Initial greedy solution
+    bestmapping = mapper(problem, stats=stats)
+    bestroutes, bestcost = heuristic(problem, bestmapping, cache=cache, stats=stats)
+
+    # Explore the solutions
+    if workers == 1 and seed is None:
+        results = [_search(problem, maxiter, bra, betarange, cache, stats)]
+    else:
+        tasks = [(n, s, bra, betarange) for n, s in zip(parallel.split(maxiter, workers), parallel.seeds(seed, workers))]
+        results = [(mapping, parallel.unpack(problem, routes), cost)
+                   for mapping, routes, cost in parallel.run(_search_stream, problem, tasks, workers)]
+        if cache is not None:
+            results = [(mapping, routes, cache.consult_all(routes)) for mapping, routes, cost in results]
+
+    # Eventually update best solution
+    for mapping, routes, cost in results:
+        if cost < bestcost:
+            bestmapping, bestroutes, bestcost = mapping, routes, cost
+    
+    return bestmapping, bestroutes, bestcost
@@ -0,0 +1,192 @@
+"""
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+This file is part of the collaboration between University of Modena and
+University of Campania "Luigi Vanvitelli". It is authored by Mattia Neroni and Marta Rinaldi.
+
+The scope is the implementation and validation of several algorithms to optimise the
+collection of milk and its delivery to the production plant or cheese factory.
+
+The problem is new in literature, and can be partially associated to the multi-source
+vehicle routing problem, with the only difference that the starting and ending depots
+are different like in the multi-source team orienteering problem.
+For a better description of the problem, please refer to scientific pubblication.
+
+
+Author: Mattia Neroni, Ph.D., Eng.
+Contact: mneroni@unimore.it
+Date: January 2022
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+"""
+import numpy as np
+
+from route import Route
+
+
+
+class Plan:
+    """
+    An instance of this class is a live plan --i.e., a set of routes that can be
+    updated farm by farm (e.g., for a one-off pickup or a farm cancelled on the day)
+    without solving the problem again.
+
+    For each route it keeps the ids of the nodes visited (source and depot included)
+    and the cumulative distance at each of them, plus the load of each route, so that
+    the cheapest feasible insertion of a farm is computed in a single vectorized pass
+    over all the arcs of the plan, and a removal only touches the route of the farm.
+    """
+    def __init__(self, problem, routes):
+        """
+        Initialise.
+
+        :param problem: The problem.
+        :param routes: The routes (kept up to date by the plan, new routes are appended).
+
+        :attr ids: For each route, the ids of the nodes from the source to the depot.
+        :attr cumcost: For each route, the cumulative distance at each node.
+        :attr load: The quantity delivered by each route.
+        :attr capacity: The capacity of the vehicle of each route.
+        :attr where: For each farm visited, the index of its route.
+        """
+        self.problem = problem
+        self.dists = problem.dists
+        self.routes = routes
+        self.ids, self.cumcost = [], []
+        self.where = {}
+        for r, route in enumerate(routes):
+            self.ids.append(np.array([route.source.id, *(n.id for n in route.nodes), route.depot.id]))
+            self.cumcost.append(self._cumulate(self.ids[-1]))
+            self.where.update((n.id, r) for n in route.nodes)
+        self.load = np.array([route.qty for route in routes], dtype=np.int64)
+        self.capacity = np.array([route.vehicle.capacity for route in routes], dtype=np.int64)
+        self._arcs = None
+
+    def __len__(self):
+        return len(self.where)
+
+    def __contains__(self, farm):
+        return farm.id in self.where
+
+    @property
+    def cost (self):
+        """ The overall distance of the plan (empty routes excluded). """
+        return sum(float(c[-1]) for c in self.cumcost if len(c) > 2)
+
+    def _cumulate (self, ids):
+        """ The cumulative distance at each node of a sequence. """
+        return np.concatenate(([0], np.cumsum(self.dists[ids[:-1], ids[1:]])))
+
+    def _update (self, r):
+        """ This method updates a route after its ids changed. """
+        route, ids = self.routes[r], self.ids[r]
+        self.cumcost[r] = self._cumulate(ids)
+        route.cost = self.cumcost[r][-1].item()
+        route.qty = self.load[r].item()
+        self._arcs = None
+
+    @property
+    def arcs (self):
+        """ The arcs of all the routes --i.e., from node, to node, and route. """
+        if self._arcs is None:
+            self._arcs = (np.concatenate([ids[:-1] for ids in self.ids]),
+                          np.concatenate([ids[1:] for ids in self.ids]),
+                          np.repeat(np.arange(len(self.ids)), [len(ids) - 1 for ids in self.ids]))
+        return self._arcs
+
+    def cheapest (self, farm):
+        """
+        This method looks for the position where a farm adds the least distance
+        without exceeding the capacity of the vehicle and Tmax.
+
+        :param farm: The farm.
+        :return: The distance added, the index of the route, and the position in
+                the route (None if the farm does not fit in any route).
+        """
+        if not self.routes:
+            return float("inf"), None, None
+        i, j, r = self.arcs
+        dists = self.dists
+        delta = dists[i, farm.id] + dists[farm.id, j] - dists[i, j]
+        costs = np.array([c[-1] for c in self.cumcost])
+        feasible = (self.load[r] + farm.qty <= self.capacity[r]) & (costs[r] + delta <= self.problem.Tmax)
+        if not feasible.any():
+            return float("inf"), None, None
+        delta = np.where(feasible, delta, np.inf)
+        k = int(np.argmin(delta))
+        r = int(r[k])
+        # The position in the route (the arcs of previous routes are skipped)
+        position = k - int(np.searchsorted(self.arcs[2], r))
+        return delta[k].item(), r, position
+
+    def insert (self, farm, *, new_route=True):
+        """
+        This method inserts a farm where it adds the least distance (see cheapest).
+        When no route can take it, a new route is made by the vehicle whose source
+        is the closest to the farm.
+
+        :param farm: The farm.
+        :param new_route: If False, new routes are not made.
+        :return: The route of the farm (None if the farm cannot be inserted).
+        """
+        if farm.id in self.where:
+            raise ValueError(f"Farm {farm.id} is already in the plan.")
+        delta, r, position = self.cheapest(farm)
+        if r is None:
+            if not new_route or (r := self._new_route(farm)) is None:
+                return None
+            position = 0
+
+        route = self.routes[r]
+        route.nodes.insert(position, farm)
+        self.ids[r] = np.insert(self.ids[r], position + 1, farm.id)
+        self.load[r] += farm.qty
+        self.where[farm.id] = r
+        self._update(r)
+        return route
+
+    def _new_route (self, farm):
+        """
+        This method makes an empty route for the vehicle whose source is the
+        closest to a farm (among the ones that can visit it).
+
+        :param farm: The farm.
+        :return: The index of the new route (None if no vehicle can visit the farm).
+        """
+        problem, dists = self.problem, self.dists
+        depot = problem.depot
+        best, source, vehicle = min(((dists[s.id, farm.id] + dists[farm.id, depot.id], s, v)
+                                     for s in problem.sources for v in s.vehicles if v.capacity >= farm.qty),
+                                    key=lambda x: x[0], default=(float("inf"), None, None))
+        if best > problem.Tmax:
+            return None
+        self.routes.append(Route(source, depot, vehicle))
+        self.ids.append(np.array([source.id, depot.id]))
+        self.cumcost.append(self._cumulate(self.ids[-1]))
+        self.load = np.append(self.load, 0)
+        self.capacity = np.append(self.capacity, vehicle.capacity)
+        return len(self.routes) - 1
+
+    def savings (self, r):
+        """
+        The distance saved removing each farm of a route.
+
+        :param r: The index of the route.
+        :return: The distance saved for each farm, in the order of the route.
+        """
+        ids, dists = self.ids[r], self.dists
+        return dists[ids[:-2], ids[1:-1]] + dists[ids[1:-1], ids[2:]] - dists[ids[:-2], ids[2:]]
+
+    def remove (self, farm):
+        """
+        This method removes a farm from its route. The route is kept even if empty.
+
+        :param farm: The farm.
+        :return: The route of the farm.
+        """
+        r = self.where.pop(farm.id)
+        route = self.routes[r]
+        position = int(np.flatnonzero(self.ids[r] == farm.id)[0])
+        del route.nodes[position - 1]
+        self.ids[r] = np.delete(self.ids[r], position)
+        self.load[r] -= farm.qty
+        self._update(r)
+        return route
@@ -18,104 +18,226 @@ Date: January 2022
 %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
 """
 import os
+import json
 import time
+import random
+import argparse
+import concurrent.futures
+
 import utils
 
 import nearest_neighbour
 import pjs
 import opt
+import stats as st
 
 
 # Output file
 OUTPUTFILE = "../results/Results.csv"
 
-
-# Clean output file 
-#open(OUTPUTFILE, "w") 
-
-
-# Function to write in output file 
-def save (string):
-    with open(OUTPUTFILE, "a") as file:
-        file.write(string)
-
-
-
-if __name__ == '__main__':
-
-
-    filenames = sorted(os.listdir("../tests/benchmarks/"), key=lambda i: len(i))
-
-
-    for filename in filenames:
-        print(filename)
-        save(f"{filename}, ")
-
-        problem = utils.read_benchmark(filename)
-
-
-
-        # NEAREST NEIGHBOUR HEURISTIC
+# Folder of the benchmarks
+BENCHMARKS = "../tests/benchmarks/"
+
+# The algorithms in the order of the columns of the output file (each of
+# them has a column for the cost and one for the time), and the algorithms
+# whose solution they need
+ALGORITHMS = {
+    "nn": (),
+    "nnm": (),
+    "nnm+opt": ("nnm",),
+    "sv": (),
+    "svm": (),
+    "svm+opt": ("svm",),
+}
+
+
+
+def read_results (filename):
+    """
+    This method reads the rows already in the output file.
+
+    :param filename: The output file.
+    :return: For each instance, the costs and times of the last row written (as strings).
+    """
+    results = {}
+    if not os.path.exists(filename):
+        return results
+    with open(filename) as file:
+        for line in file:
+            # A line not terminated has been interrupted
+            if not line.endswith("\n"):
+                continue
+            instance, *fields = (f.strip() for f in line.split(","))
+            fields = (fields + [""] * 2 * len(ALGORITHMS))[:2 * len(ALGORITHMS)]
+            results[instance] = fields
+    return results
+
+
+
+def write_results (filename, results):
+    """
+    This method writes the output file with all the rows. The rows are written
+    to a temporary file that then replaces the output file, so that a crash
+    leaves either the old or the new file, and each instance has one row only.
+
+    :param filename: The output file.
+    :param results: For each instance, its costs and times (as strings).
+    """
+    temporary = filename + ".tmp"
+    with open(temporary, "w") as file:
+        for instance, fields in results.items():
+            file.write(f"{instance}, {','.join(fields)},\n")
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, filename)
+
+
+
+def missing (fields, algorithms):
+    """
+    The algorithms whose columns are still empty in a row.
+
+    :param fields: The costs and times of the row.
+    :param algorithms: The algorithms required.
+    :return: The algorithms to run.
+    """
+    columns = list(ALGORITHMS)
+    return [a for a in algorithms if fields[2 * columns.index(a)] == ""]
+
+
+
+def solve (filename, algorithms, maxiter, maxtime, collect=False):
+    """
+    This method solves an instance with some algorithms.
+
+    :param filename: The file of the instance.
+    :param algorithms: The algorithms to run.
+    :param maxiter: The iterations of the multistarts.
+    :param maxtime: The maximum time of the 2-OPT of each route.
+    :param collect: True if the stats of the algorithms are collected.
+    :return: For each algorithm run, its cost and time, and the stats (None if not collected).
+    """
+    # Each instance has its own random stream
+    random.seed()
+
+    stats = st.Stats() if collect else None
+    with st.timer(stats, "build"):
+        problem = utils.read_benchmark(filename, path=BENCHMARKS)
+
+    # Run the algorithms needed by the ones required too
+    required = {d for a in algorithms for d in ALGORITHMS[a]} | set(algorithms)
+    results, solutions = {}, {}
+
+    # NEAREST NEIGHBOUR HEURISTIC
+    if "nn" in required:
         _start = time.time()
-        nn_routes, nn_cost = nearest_neighbour.heuristic(problem)
-        nn_duration =  time.time() - _start
-        save(f"{int(nn_cost)},{round(nn_duration, 3)},")
+        nn_routes, nn_cost = nearest_neighbour.heuristic(problem, stats=stats)
+        results["nn"] = (nn_cost, time.time() - _start)
         assert len(nn_routes) == problem.n_vehicles
 
-
-
-        # NEAREST NEIGHBOUR MULTISTART
+    # NEAREST NEIGHBOUR MULTISTART
+    if "nnm" in required:
         _start = time.time()
-        nnm_routes, nnm_cost = nearest_neighbour.multistart(problem, maxiter=1000, betarange=(0.1, 0.3))
-        nnm_duration =  time.time() - _start
-        save(f"{int(nnm_cost)},{round(nnm_duration, 3)},")
+        nnm_routes, nnm_cost = nearest_neighbour.multistart(problem, maxiter=maxiter, betarange=(0.1, 0.3), stats=stats)
+        results["nnm"] = (nnm_cost, time.time() - _start)
+        solutions["nnm"] = nnm_routes
         assert len(nnm_routes) == problem.n_vehicles
-        
-        #utils.plot(problem, routes=nnm_routes)
 
+    # NEAREST NEIGHBOUR MULTISTART + 2-OPT
+    if "nnm+opt" in required:
+        _start = time.time()
+        _, nnm_opt_cost = opt.allOPT2(solutions["nnm"], problem.dists, maxtime=maxtime, stats=stats)
+        results["nnm+opt"] = (nnm_opt_cost, time.time() - _start + results["nnm"][1])
 
-        
-        # NEAREST NEIGHBOUR MULTISTART + 2-OPT
+    # SAVINGS BASED HEURISTIC 
+    if "sv" in required:
         _start = time.time()
-        nnm_opt_routes, nnm_opt_cost = opt.allOPT2(nnm_routes, problem.dists, maxtime=300)
-        nnm_opt_duration = time.time() - _start + nnm_duration
-        save(f"{int(nnm_opt_cost)},{round(nnm_opt_duration, 3)},") 
-    
+        mapping = pjs.mapper(problem, stats=stats)
+        sv_routes, sv_cost = pjs.heuristic(problem, mapping, stats=stats)
+        results["sv"] = (sv_cost, time.time() - _start)
+        assert len(sv_routes) == problem.n_vehicles
 
+    # SAVINGS BASED MULTISTART 
+    if "svm" in required:
+        _start = time.time()
+        _, svm_routes, svm_cost = pjs.multistart(problem, maxiter=maxiter, bra=(True, True), betarange = ((0.1, 0.3), (0.1, 0.3)), stats=stats)
+        results["svm"] = (svm_cost, time.time() - _start)
+        solutions["svm"] = svm_routes
+        assert len(svm_routes) == problem.n_vehicles
 
-        
-        # SAVINGS BASED HEURISTIC 
+    # SAVINGS BASED MULTISTART + 2-OPT
+    if "svm+opt" in required:
         _start = time.time()
-        mapping = pjs.mapper(problem)
-        sv_routes, sv_cost = pjs.heuristic(problem, mapping)
-        sv_duration = time.time() - _start
-        save(f"{int(sv_cost)},{round(sv_duration, 3)},")
-        assert len(sv_routes) == problem.n_vehicles
-        #print(problem.n_vehicles, len(sv_routes))
-        #utils.plot(problem, routes=sv_routes, mapping=mapping)
+        _, svm_opt_cost = opt.allOPT2(solutions["svm"], problem.dists, maxtime=maxtime, stats=stats)
+        results["svm+opt"] = (svm_opt_cost, time.time() - _start + results["svm"][1])
 
+    results = {a: (str(int(cost)), str(round(duration, 3))) for a, (cost, duration) in results.items()}
+    return results, stats and stats.asdict()
 
-        
 
-        # SAVINGS BASED MULTISTART 
-        _start = time.time()
-        mapping, svm_routes, svm_cost = pjs.multistart(problem, maxiter=1000, bra=(True, True), betarange = ((0.1, 0.3), (0.1, 0.3)))
-        svm_duration = time.time() - _start
-        save(f"{int(svm_cost)},{round(svm_duration, 3)},")
-        assert len(svm_routes) == problem.n_vehicles
-        #print(problem.n_vehicles, len(svm_routes))
-        #utils.plot(problem, routes=svm_routes, mapping=mapping)
 
+def parse_args (args=None):
+    """ The options of the command line. """
+    parser = argparse.ArgumentParser(description="Run the algorithms on the benchmarks and save costs and times.")
+    parser.add_argument("--algorithms", nargs="+", choices=list(ALGORITHMS), default=list(ALGORITHMS),
+                        help="The algorithms to run (default all).")
+    parser.add_argument("--maxiter", type=int, default=1000, help="The iterations of the multistarts.")
+    parser.add_argument("--maxtime", type=float, default=300, help="The maximum time of the 2-OPT of each route.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="The instances solved at the same time.")
+    parser.add_argument("--output", default=OUTPUTFILE, help="The output file.")
+    parser.add_argument("--stats", action="store_true", help="Save the stats of the algorithms in a JSON next to the output file.")
+    parser.add_argument("instances", nargs="*", help="The instances to solve (default all the benchmarks).")
+    return parser.parse_args(args)
 
 
 
-        # SAVINGS BASED MULTISTART + 2-OPT
-        _start = time.time()
-        svm_opt_routes, svm_opt_cost = opt.allOPT2(svm_routes, problem.dists, maxtime=300)
-        svm_opt_duration = time.time() - _start + svm_duration
-        save(f"{int(svm_opt_cost)},{round(svm_opt_duration, 3)},")
-        #utils.plot(problem, routes=svm_opt_routes, mapping=mapping)
-        
-        save("\n")
-        
-    print("Program concluded \u2764\uFE0F")
+if __name__ == '__main__':
+
+    args = parse_args()
+
+    filenames = args.instances or sorted((f for f in os.listdir(BENCHMARKS) if f.endswith(".txt")), key=lambda i: len(i))
+
+    # Instances with a complete row are skipped, so that a run can be resumed
+    # (a row interrupted by a crash of an old run is ignored)
+    done = read_results(args.output)
+    empty = [""] * 2 * len(ALGORITHMS)
+    todo = {f: missing(done.get(f, empty), args.algorithms) for f in filenames}
+    todo = {f: algorithms for f, algorithms in todo.items() if algorithms}
+    print(f"{len(filenames) - len(todo)} instances already solved, {len(todo)} to solve")
+
+    # The stats of each instance (see stats.Stats)
+    statsfile = os.path.splitext(args.output)[0] + "Stats.json"
+    allstats = {}
+    if args.stats and os.path.exists(statsfile):
+        with open(statsfile) as file:
+            allstats = json.load(file)
+
+    # The instances are solved by a pool of processes, while this is the only
+    # process writing; the results of each instance are merged with the ones
+    # of the previous runs, and an instance that fails does not stop the others
+    failed = []
+    with concurrent.futures.ProcessPoolExecutor(args.workers) as pool:
+        futures = {pool.submit(solve, f, algorithms, args.maxiter, args.maxtime, args.stats): f for f, algorithms in todo.items()}
+        for future in concurrent.futures.as_completed(futures):
+            filename = futures[future]
+            try:
+                results, stats = future.result()
+            except Exception as error:
+                failed.append(filename)
+                print(f"{filename} failed: {error!r}")
+                continue
+            fields = list(done.get(filename, empty))
+            for algorithm, (cost, duration) in results.items():
+                k = 2 * list(ALGORITHMS).index(algorithm)
+                fields[k:k + 2] = cost, duration
+            done[filename] = fields
+            write_results(args.output, done)
+            if stats is not None:
+                allstats[filename] = stats
+                with open(statsfile, "w") as f:
+                    json.dump(allstats, f, indent=2)
+            print(filename)
+
+    if failed:
+        print(f"{len(failed)} instances failed: {', '.join(failed)}")
+    print("Program concluded ❤️")
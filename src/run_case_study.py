@@ -19,11 +19,11 @@ Date: January 2022
 """
 import os
 import time
-import utils
 
 import nearest_neighbour
 import pjs
 import opt
+import multiperiod
 
 
 # Output file
@@ -50,13 +50,15 @@ if __name__ == '__main__':
     )
 
 
-    for filename in filenames:
+    # The months share nodes, fleet, and distances (see multiperiod)
+    problems = multiperiod.read(filenames)
+
+
+    for filename, problem in zip(filenames, problems):
 
         print(filename)
         save(f"{filename}, ")
 
-        problem = utils.read_real_problem(filename)
-
 
         # NEAREST NEIGHBOUR HEURISTIC
         _start = time.time()
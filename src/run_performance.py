@@ -0,0 +1,467 @@
+"""
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+This file is part of the collaboration between University of Modena and
+University of Campania "Luigi Vanvitelli". It is authored by Mattia Neroni and Marta Rinaldi.
+
+The scope is the implementation and validation of several algorithms to optimise the
+collection of milk and its delivery to the production plant or cheese factory.
+
+The problem is new in literature, and can be partially associated to the multi-source
+vehicle routing problem, with the only difference that the starting and ending depots
+are different like in the multi-source team orienteering problem.
+For a better description of the problem, please refer to scientific pubblication.
+
+
+Author: Mattia Neroni, Ph.D., Eng.
+Contact: mneroni@unimore.it
+Date: January 2022
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+"""
+import os
+import sys
+import copy
+import time
+import random
+import json
+import resource
+import tempfile
+import tracemalloc
+import concurrent.futures
+
+import numpy as np
+
+import grasp
+import generator
+import utils
+import pjs
+import nearest_neighbour
+import opt
+import cache
+import interroute
+import multiperiod
+import plan
+import warmstart
+
+
+# Sizes (i.e., number of farms) of the random instances used for the scaling tests
+SIZES = (100, 200, 400, 800, 1600)
+
+
+
+def random_problem (n_farms, n_sources=2, vehicles_per_source=2, capacity=1000, seed=0):
+    """
+    This method generates a random problem with farms uniformly distributed
+    in a square, used to measure how the algorithms scale.
+
+    :param n_farms: The number of farms to visit.
+    :param n_sources: The number of sources.
+    :param vehicles_per_source: The number of vehicles starting from each source.
+    :param capacity: The capacity of vehicles.
+    :param seed: The seed of the random generator.
+    :return: The problem instance.
+    """
+    return generator.generate(n_farms, n_sources=n_sources, fleet=(capacity,) * vehicles_per_source,
+                              seed=seed, name=f"random_{n_farms}")
+
+
+
+def construction ():
+    """
+    Time needed to build the problem (i.e., distances, savings, and edges)
+    for instances of increasing size.
+    """
+    print("Problem construction")
+    for n_farms in SIZES:
+        _start = time.time()
+        random_problem(n_farms).edges
+        print(f"{n_farms} farms: {round(time.time() - _start, 3)}s")
+
+
+
+def loading ():
+    """
+    Time needed to load the largest benchmark and solve it with the savings based
+    heuristic, parsing its file, and from its compiled instance.
+    """
+    print("Loading and solving the largest benchmark")
+    filename = max(os.listdir("../tests/benchmarks/"), key=lambda i: os.path.getsize("../tests/benchmarks/" + i))
+    with tempfile.TemporaryDirectory() as cache:
+        for name, kwargs in (("parse", {"cache": None}), ("cold cache", {"cache": cache}), ("warm cache", {"cache": cache})):
+            _start = time.time()
+            problem = utils.read_benchmark(filename, **kwargs)
+            loaded = time.time() - _start
+            pjs.heuristic(problem, pjs.mapper(problem))
+            print(f"{filename} {name}: load {round(loaded, 4)}s, load and solve {round(time.time() - _start, 4)}s")
+
+
+
+def _peak_rss ():
+    """ The peak resident set size of the process in MB. """
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+
+def dists_loading ():
+    """
+    Time and peak memory (traced by Python) needed to load a matrix of road
+    distances of 5000 farms from json, and from its binary memory mapped
+    file, once and for 12 months.
+    """
+    print("Loading a 5000 farms matrix of distances")
+    problem = random_problem(5000)
+    with tempfile.TemporaryDirectory() as path:
+        filename = os.path.join(path, "dists.json")
+        with open(filename, "w") as file:
+            json.dump({"dists": np.rint(problem.dists).astype(int).tolist()}, file)
+        del problem
+
+        cache = os.path.join(path, "cache")
+        for name, kwargs, times in (("json", {"cache": None}, 1), ("conversion", {"cache": cache}, 1),
+                                    ("memory map", {"cache": cache}, 1), ("memory map x 12", {"cache": cache}, 12)):
+            tracemalloc.start()
+            _start = time.time()
+            months = [utils.read_dists(filename, **kwargs) for _ in range(times)]
+            duration = time.time() - _start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{name}: {round(duration, 3)}s, {round(peak / 2 ** 20, 1)}MB")
+            del months
+
+
+
+def memory ():
+    """
+    Peak memory needed to build the largest benchmark and a large random
+    instance and to solve them with the savings based heuristic.
+    """
+    print("Peak RSS")
+    filename = max(os.listdir("../tests/benchmarks/"), key=lambda i: os.path.getsize("../tests/benchmarks/" + i))
+    for name, build in ((filename, lambda: utils.read_benchmark(filename)), ("random_2000", lambda: random_problem(2000))):
+        before = _peak_rss()
+        problem = build()
+        pjs.heuristic(problem, pjs.mapper(problem))
+        print(f"{name}: {before}MB before, {_peak_rss()}MB after")
+        del problem
+
+
+
+def multistart ():
+    """
+    Speedup of the multistart procedures running on all the available cores
+    compared to a single process, on a sample of the benchmarks.
+    """
+    workers = os.cpu_count()
+    print(f"Multistart speedup with {workers} workers")
+    for filename in sorted(os.listdir("../tests/benchmarks/"))[1::10]:
+        problem = utils.read_benchmark(filename)
+        durations = []
+        for w in (1, workers):
+            _start = time.time()
+            pjs.multistart(problem, maxiter=200, workers=w, seed=0)
+            nearest_neighbour.multistart(problem, maxiter=200, workers=w, seed=0)
+            durations.append(time.time() - _start)
+        print(f"{filename}: {round(durations[0], 3)}s -> {round(durations[1], 3)}s (x{round(durations[0] / durations[1], 2)})")
+
+
+
+def nearest_neighbour_steps ():
+    """
+    Average time of a construction step of the nearest neighbour heuristic,
+    both greedy and biased randomised, for instances of increasing size.
+    """
+    print("Nearest neighbour construction step")
+    for n_farms in SIZES:
+        problem = random_problem(n_farms)
+        problem.neighbours
+        for bra in (False, True):
+            random.seed(0)
+            _start = time.time()
+            nearest_neighbour.heuristic(problem, bra=bra)
+            step = (time.time() - _start) / n_farms
+            print(f"{n_farms} farms{' (BRA)' if bra else ''}: {round(step * 1e6, 1)}us")
+
+
+
+def two_opt ():
+    """
+    Time needed by the 2-OPT to optimise the routes built by the nearest
+    neighbour heuristic on instances of increasing size.
+    """
+    print("2-OPT")
+    for n_farms in SIZES:
+        problem = random_problem(n_farms)
+        routes, cost = nearest_neighbour.heuristic(problem)
+        _start = time.time()
+        _, opt_cost = opt.allOPT2(routes, problem.dists)
+        farms = max(len(r.nodes) for r in routes)
+        print(f"{n_farms} farms (longest route {farms}): {round(cost, 3)} -> {round(opt_cost, 3)} in {round(time.time() - _start, 3)}s")
+
+
+
+def parallel_opt ():
+    """
+    Time needed by the 2-OPT on a 25-vehicle fleet when routes are optimised
+    one after the other and on pools of processes, which must give the same routes.
+    """
+    print("Parallel 2-OPT")
+    problem = random_problem(SIZES[-1], n_sources=5, vehicles_per_source=5)
+    routes, _ = pjs.heuristic(problem, pjs.mapper(problem))
+    expected = None
+    for workers in (1, 2, 4, os.cpu_count()):
+        _start = time.time()
+        oproutes, cost = opt.allOPT2(copy.deepcopy(routes), problem.dists, maxtime=60, workers=workers)
+        result = ([[n.id for n in r.nodes] for r in oproutes], cost)
+        expected = expected or result
+        assert result == expected, "Parallel 2-OPT differs from the sequential one"
+        print(f"{workers} workers: {round(cost, 3)} in {round(time.time() - _start, 3)}s")
+
+
+
+def exact ():
+    """
+    Cost and time of the 2-OPT and of the exact optimisation of short routes
+    (Held-Karp) on the months of the case study.
+    """
+    print("2-OPT vs Held-Karp on short routes")
+    for filename in sorted(f for f in os.listdir("../tests/casestudy/") if f.endswith(".txt")):
+        problem = utils.read_real_problem(filename)
+        routes, cost = pjs.heuristic(problem, pjs.mapper(problem))
+        results = []
+        for exact_size in (0, opt.EXACT_SIZE):
+            _start = time.time()
+            _, opt_cost = opt.allOPT2(copy.deepcopy(routes), problem.dists, maxtime=60, exact_size=exact_size)
+            results.append(f"{round(opt_cost, 3)} in {round(time.time() - _start, 3)}s")
+        print(f"{filename}: {round(cost, 3)} -> 2-OPT {results[0]}, Held-Karp {results[1]}")
+
+
+
+def route_cache ():
+    """
+    Time of the 2-OPT made after each of some multistarts on the same
+    problem, without and with a cache of the routes already optimised.
+    """
+    print("2-OPT after multistart with and without route cache")
+    for problem in (utils.read_benchmark("p457_4.txt"), random_problem(SIZES[2])):
+        solutions = [pjs.multistart(problem, maxiter=50, seed=seed)[1] for seed in range(5)]
+        solutions += [nearest_neighbour.multistart(problem, maxiter=50, seed=seed)[0] for seed in range(5)]
+        results = []
+        for routecache in (None, cache.RouteCache()):
+            _start = time.time()
+            costs = [opt.allOPT2(copy.deepcopy(routes), problem.dists, maxtime=60, cache=routecache)[1] for routes in solutions]
+            results.append(f"{round(min(costs), 3)} in {round(time.time() - _start, 3)}s")
+        print(f"{problem.name}: without cache {results[0]}, with cache {results[1]} {routecache.stats}")
+
+
+
+def multi_period ():
+    """
+    Time needed to build the 12 months of the case study, and 12 periods of a
+    large random area, as independent problems and from a shared core, and to
+    solve the months back to back and on all the available cores.
+    """
+    print("Multi-period build and solve")
+    months = ("gennaio.txt", "febbraio.txt", "marzo.txt", "aprile.txt", "maggio.txt", "giugno.txt",
+              "luglio.txt", "agosto.txt", "settembre.txt", "ottobre.txt", "novembre.txt", "dicembre.txt")
+
+    def warm (problems):
+        for problem in problems:
+            for attr in utils.Problem.SHARED:
+                getattr(problem, attr)
+        return problems
+
+    _start = time.time()
+    warm([utils.read_real_problem(f, cache=None) for f in months])
+    independent = time.time() - _start
+    _start = time.time()
+    problems = warm(multiperiod.read(months, cache=None))
+    print(f"Case study build: independent {round(independent, 3)}s, shared {round(time.time() - _start, 3)}s")
+
+    area = random_problem(SIZES[-1])
+    rnd = random.Random(0)
+    periods = [[rnd.randint(1, 10) for _ in range(area.n_nodes)] for _ in months]
+    _start = time.time()
+    for i, quantities in enumerate(periods):
+        nodes = [copy.copy(n) for n in area.iternodes()]
+        for n in nodes:
+            n.qty = quantities[n.id]
+        warm([utils.Problem(str(i), area.n_nodes, area.n_vehicles, area.Tmax, tuple(nodes[:len(area.sources)]),
+                            tuple(nodes[len(area.sources):-1]), nodes[-1])])
+    independent = time.time() - _start
+    _start = time.time()
+    warm([area])
+    warm([area.with_quantities(str(i), quantities) for i, quantities in enumerate(periods)])
+    print(f"{SIZES[-1]} farms build: independent {round(independent, 3)}s, shared {round(time.time() - _start, 3)}s")
+
+    for workers in (1, os.cpu_count()):
+        _start = time.time()
+        multiperiod.solve(problems, maxiter=1000, maxtime=60, workers=workers, seed=0)
+        print(f"Case study solve with {workers} workers: {round(time.time() - _start, 3)}s")
+
+
+
+def warm_start ():
+    """
+    Cost and time of a new plan made from scratch (savings based multistart and
+    2-OPT) and re-optimising the plan of the previous period, for the months of the
+    case study and for a random area where quantities change and 5% farms are added.
+    """
+    print("Cold start vs warm start")
+    months = ("gennaio.txt", "febbraio.txt", "marzo.txt", "aprile.txt", "maggio.txt", "giugno.txt",
+              "luglio.txt", "agosto.txt", "settembre.txt", "ottobre.txt", "novembre.txt", "dicembre.txt")
+    n_farms = SIZES[-2]
+    problems = multiperiod.read(months)
+    cases = [(p, q, 1000, lambda n: n.id) for p, q in zip(problems, problems[1:])]
+    cases.append((random_problem(n_farms), random_problem(n_farms + n_farms // 20), 100, lambda n: (n.x, n.y)))
+
+    previous = None
+    for problem, updated, maxiter, key in cases:
+        if previous is None or previous[0] is not problem:
+            random.seed(0)
+            _, routes, _ = pjs.multistart(problem, maxiter=maxiter)
+            previous = (problem, opt.allOPT2(routes, problem.dists)[0])
+
+        random.seed(0)
+        _start = time.time()
+        _, routes, _ = pjs.multistart(updated, maxiter=maxiter)
+        _, cold_cost = opt.allOPT2(routes, updated.dists)
+        cold = time.time() - _start
+
+        _start = time.time()
+        routes, warm_cost, rejected = warmstart.reoptimise(updated, previous[1], key=key)
+        warm = time.time() - _start
+        previous = (updated, routes)
+        print(f"{updated.name}: cold {round(cold_cost, 3)} in {round(cold, 3)}s, "
+              f"warm {round(warm_cost, 3)} in {round(warm, 3)}s ({len(rejected)} farms not visited)")
+
+
+
+def live_plan ():
+    """
+    Latency of cancelling a farm on the day and of adding it back as a one-off
+    pickup (see plan.Plan) on the plan of a random area of 1000 farms, against
+    solving the whole problem again with the savings based heuristic.
+    """
+    print("Live plan updates on 1000 farms")
+    problem = random_problem(1000)
+    _start = time.time()
+    routes, _ = pjs.heuristic(problem, pjs.mapper(problem))
+    print(f"Solving again: {round(1000 * (time.time() - _start), 3)}ms")
+
+    live = plan.Plan(problem, list(routes))
+    random.seed(0)
+    removes, inserts = [], []
+    for farm in random.choices(problem.nodes, k=1000):
+        _start = time.perf_counter()
+        live.remove(farm)
+        removes.append(time.perf_counter() - _start)
+        _start = time.perf_counter()
+        live.insert(farm)
+        inserts.append(time.perf_counter() - _start)
+    for name, latencies in (("Remove", removes), ("Insert", inserts)):
+        latencies = 1000 * np.array(latencies)
+        print(f"{name}: mean {round(latencies.mean(), 3)}ms, p99 {round(np.percentile(latencies, 99), 3)}ms")
+
+
+
+def local_search ():
+    """
+    Time to local optimum and cost of the 2-OPT and of the neighbour
+    lists local search, starting from the routes of the nearest neighbour
+    heuristic, on the benchmarks and on large random instances.
+    """
+    print("2-OPT vs neighbour lists local search")
+    problems = [utils.read_benchmark(f) for f in sorted(os.listdir("../tests/benchmarks/"))[1::10]]
+    problems += [random_problem(n_farms) for n_farms in SIZES[-2:]]
+    for problem in problems:
+        routes, cost = nearest_neighbour.heuristic(problem)
+        results = []
+        for optimise in (opt.allOPT2, opt.allLS):
+            _start = time.time()
+            _, opt_cost = optimise(copy.deepcopy(routes), problem.dists, maxtime=60)
+            results.append(f"{round(opt_cost, 3)} in {round(time.time() - _start, 3)}s")
+        print(f"{problem.name}: {round(cost, 3)} -> 2-OPT {results[0]}, LS {results[1]}")
+
+
+
+def inter_route ():
+    """
+    Cost and time of the inter-route local search (relocate, exchange and 2-opt*)
+    starting from the routes of the two heuristics, on the benchmarks and on
+    large random instances.
+    """
+    print("Inter-route local search")
+    problems = [utils.read_benchmark(f) for f in sorted(os.listdir("../tests/benchmarks/"))[1::10]]
+    problems += [random_problem(n_farms) for n_farms in SIZES[-2:]]
+    for problem in problems:
+        for name, (routes, cost) in (("PJS", pjs.heuristic(problem, pjs.mapper(problem))),
+                                     ("NN", nearest_neighbour.heuristic(problem))):
+            _start = time.time()
+            _, opt_cost = interroute.improve(problem, routes, maxtime=60)
+            print(f"{problem.name} {name}: {round(cost, 3)} -> {round(opt_cost, 3)} in {round(time.time() - _start, 3)}s")
+
+
+
+def samplers ():
+    """
+    Time needed to draw all the options with the GRASP and BRA samplers
+    over one million options.
+    """
+    print("Samplers over 10^6 options")
+    options = range(10 ** 6)
+    for name, sampler in (("BRA", grasp.BRA), ("GRASP", grasp.GRASP)):
+        _start = time.time()
+        for _ in sampler(options):
+            pass
+        print(f"{name}: {round(time.time() - _start, 3)}s")
+
+
+
+def concurrency ():
+    """
+    Many solves running at the same time in threads on the same problem
+    must give the same solutions they give when run one after the other.
+    """
+    print("Concurrent solves on the same problem")
+    problem = utils.read_benchmark("p457_4.txt")
+
+    def solve (i):
+        if i % 2 == 0:
+            return nearest_neighbour.heuristic(problem)[1]
+        return pjs.heuristic(problem, pjs.mapper(problem))[1]
+
+    expected = [solve(i) for i in range(64)]
+    _start = time.time()
+    with concurrent.futures.ThreadPoolExecutor(16) as pool:
+        costs = list(pool.map(solve, range(64)))
+    assert costs == expected, "Concurrent solves interfered with each other"
+    print(f"64 solves on 16 threads: {round(time.time() - _start, 3)}s")
+
+
+
+BENCHMARKS = {
+    "construction": construction,
+    "loading": loading,
+    "dists_loading": dists_loading,
+    "memory": memory,
+    "multistart": multistart,
+    "nearest_neighbour": nearest_neighbour_steps,
+    "opt": two_opt,
+    "parallel_opt": parallel_opt,
+    "exact": exact,
+    "route_cache": route_cache,
+    "multi_period": multi_period,
+    "warm_start": warm_start,
+    "live_plan": live_plan,
+    "local_search": local_search,
+    "inter_route": inter_route,
+    "samplers": samplers,
+    "concurrency": concurrency,
+}
+
+
+
+if __name__ == '__main__':
+
+    # Run only the benchmarks passed as arguments, or all of them
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
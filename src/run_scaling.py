@@ -0,0 +1,183 @@
+"""
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+This file is part of the collaboration between University of Modena and
+University of Campania "Luigi Vanvitelli". It is authored by Mattia Neroni and Marta Rinaldi.
+
+The scope is the implementation and validation of several algorithms to optimise the
+collection of milk and its delivery to the production plant or cheese factory.
+
+The problem is new in literature, and can be partially associated to the multi-source
+vehicle routing problem, with the only difference that the starting and ending depots
+are different like in the multi-source team orienteering problem.
+For a better description of the problem, please refer to scientific pubblication.
+
+
+Author: Mattia Neroni, Ph.D., Eng.
+Contact: mneroni@unimore.it
+Date: January 2022
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+"""
+import os
+import sys
+import copy
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+import utils
+import generator
+import nearest_neighbour
+import pjs
+import opt
+
+
+# Sizes of the instances (number of farms)
+SIZES = (250, 500, 1000, 2000)
+
+# Baseline the results are compared to
+BASELINE = "../results/scaling_baseline.json"
+
+# Seed of the instances and of the algorithms
+SEED = 0
+
+# Growths of runtime (s) and peak memory (MB) too small to be regressions
+NOISE = {"time": 0.05, "memory": 1.0, "cost": 1e-6}
+
+
+
+def build (filename, path):
+    """
+    This method reads an instance and computes all the data the
+    algorithms need (e.g., sorted savings, preferences of vehicles, neighbours).
+    """
+    problem = utils.read_benchmark(filename, path=path, cache=None)
+    problem.savings_order, problem.vehicle_preferences, problem.quantities, problem.neighbours
+    return problem
+
+
+
+def measure (phase, *args):
+    """
+    This method runs a phase of an algorithm twice, once to measure its
+    runtime and once to measure its peak memory, since tracing the memory
+    slows down the execution. Both runs receive a copy of the arguments and
+    the same random seed.
+
+    :param phase: The phase.
+    :param args: The arguments of the phase.
+    :return: The result of the phase, its runtime in seconds, and its peak memory in MB.
+    """
+    random.seed(SEED)
+    arguments = copy.deepcopy(args)
+    _start = time.perf_counter()
+    result = phase(*arguments)
+    duration = time.perf_counter() - _start
+
+    random.seed(SEED)
+    arguments = copy.deepcopy(args)
+    tracemalloc.start()
+    phase(*arguments)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, duration, peak / 2 ** 20
+
+
+
+def scale (n_farms, *, clusters, clustering, maxtime):
+    """
+    This method generates an instance and measures each phase of the algorithms.
+
+    :param n_farms: The number of farms.
+    :param clusters: The number of clusters of farms.
+    :param clustering: The share of farms in clusters.
+    :param maxtime: The maximum time of the 2-OPT of each route.
+    :return: For each phase, its runtime, peak memory, and cost (if any).
+    """
+    problem = generator.generate(n_farms, n_sources=3, fleet=(713, 1126, 1126), clusters=clusters,
+                                 clustering=clustering, seed=SEED)
+    with tempfile.TemporaryDirectory() as path:
+        utils.export(problem, path + "/")
+        problem, build_time, build_memory = measure(build, problem.name, path + "/")
+    results = {"build": {"time": build_time, "memory": build_memory}}
+
+    mapping, *measures = measure(pjs.mapper, problem)
+    results["mapper"] = dict(zip(("time", "memory"), measures))
+
+    (routes, cost), *measures = measure(pjs.heuristic, problem, mapping)
+    results["savings"] = dict(zip(("time", "memory"), measures), cost=cost)
+
+    (_, nn_cost), *measures = measure(nearest_neighbour.heuristic, problem)
+    results["nearest_neighbour"] = dict(zip(("time", "memory"), measures), cost=nn_cost)
+
+    (_, opt_cost), *measures = measure(opt.allOPT2, routes, problem.dists, maxtime)
+    results["opt"] = dict(zip(("time", "memory"), measures), cost=opt_cost)
+
+    return {phase: {k: float(v) for k, v in values.items()} for phase, values in results.items()}
+
+
+
+def regressions (results, baseline, tolerance):
+    """
+    This method compares the results with the baseline. Runtime and peak memory
+    are regressions if they grow more than the tolerance, cost if it grows at all
+    (growths within the noise are ignored, see NOISE).
+
+    :param results: For each size, the measures of each phase (see scale).
+    :param baseline: The results of the baseline.
+    :param tolerance: The relative growth of runtime and memory tolerated.
+    :return: The descriptions of the regressions found.
+    """
+    found = []
+    for size, phases in results.items():
+        for phase, values in phases.items():
+            for measure_, value in values.items():
+                reference = baseline.get(size, {}).get(phase, {}).get(measure_)
+                if reference is None:
+                    continue
+                limit = reference + NOISE[measure_]
+                if measure_ != "cost":
+                    limit = max(limit, reference * (1 + tolerance))
+                if value > limit:
+                    found.append(f"{size} farms, {phase}: {measure_} {round(value, 3)} (baseline {round(reference, 3)})")
+    return found
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Measure how the algorithms scale on synthetic instances.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES), help="The numbers of farms.")
+    parser.add_argument("--clusters", type=int, default=10, help="The number of clusters of farms.")
+    parser.add_argument("--clustering", type=float, default=0.5, help="The share of farms in clusters.")
+    parser.add_argument("--maxtime", type=float, default=60, help="The maximum time of the 2-OPT of each route.")
+    parser.add_argument("--baseline", default=BASELINE, help="The baseline JSON.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="The relative growth of runtime and memory tolerated.")
+    parser.add_argument("--save", action="store_true", help="Save the results as the new baseline.")
+    parser.add_argument("--output", default=None, help="A JSON file where the results are saved.")
+    args = parser.parse_args()
+
+    results = {}
+    for n_farms in args.sizes:
+        results[str(n_farms)] = scale(n_farms, clusters=args.clusters, clustering=args.clustering, maxtime=args.maxtime)
+        for phase, values in results[str(n_farms)].items():
+            cost = f", cost {round(values['cost'], 3)}" if "cost" in values else ""
+            print(f"{n_farms} farms, {phase}: {round(values['time'], 3)}s, {round(values['memory'], 1)}MB{cost}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.save:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Baseline saved in {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            found = regressions(results, json.load(file), args.tolerance)
+        for regression in found:
+            print(f"REGRESSION {regression}")
+        print(f"{len(found)} regressions against {args.baseline}")
+        sys.exit(1 if found else 0)
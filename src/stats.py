@@ -0,0 +1,84 @@
+"""
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+This file is part of the collaboration between University of Modena and
+University of Campania "Luigi Vanvitelli". It is authored by Mattia Neroni and Marta Rinaldi.
+
+The scope is the implementation and validation of several algorithms to optimise the
+collection of milk and its delivery to the production plant or cheese factory.
+
+The problem is new in literature, and can be partially associated to the multi-source
+vehicle routing problem, with the only difference that the starting and ending depots
+are different like in the multi-source team orienteering problem.
+For a better description of the problem, please refer to scientific pubblication.
+
+
+Author: Mattia Neroni, Ph.D., Eng.
+Contact: mneroni@unimore.it
+Date: January 2022
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+"""
+import collections
+import contextlib
+import json
+import time
+
+
+
+class Stats:
+    """
+    An instance of this class collects counters and times of the algorithms,
+    to understand where a run spends its time (e.g., edges scanned, merges
+    rejected, 2-opt moves evaluated).
+
+    It is opt-in: the algorithms receive stats=None by default, in which
+    case nothing is counted.
+    """
+    def __init__(self):
+        """
+        Initialise.
+
+        :attr counters: The counters by name (e.g., "savings.rejected.capacity").
+        :attr times: The seconds spent in each phase by name (e.g., "savings.merge").
+        """
+        self.counters = collections.Counter()
+        self.times = collections.defaultdict(float)
+
+    def count (self, name, n=1):
+        """ Increase a counter. """
+        self.counters[name] += n
+
+    @contextlib.contextmanager
+    def timer (self, phase):
+        """ A context manager that adds the time spent in it to a phase. """
+        _start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.times[phase] += time.perf_counter() - _start
+
+    def update (self, other):
+        """ Add the counters and times of other stats (or of their dict, see asdict). """
+        other = other.asdict() if isinstance(other, Stats) else other
+        self.counters.update(other["counters"])
+        for phase, seconds in other["times"].items():
+            self.times[phase] += seconds
+
+    def asdict (self):
+        """ The counters and times as a dictionary that can be dumped as JSON. """
+        return {"counters": dict(sorted(self.counters.items())), "times": dict(sorted(self.times.items()))}
+
+    def dump (self, filename):
+        """ Save the counters and times in a JSON file. """
+        with open(filename, "w") as file:
+            json.dump(self.asdict(), file, indent=2)
+
+
+
+def timer (stats, phase):
+    """
+    A context manager that adds the time spent in it to a phase
+    of the stats, or that does nothing if stats are None.
+    """
+    if stats is None:
+        return contextlib.nullcontext()
+    return stats.timer(phase)
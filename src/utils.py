@@ -19,12 +19,18 @@ Date: January 2022
 """
 import os
 import math
-import itertools
 import collections
+import copy
+import functools
+import itertools
 import numpy as np
 import networkx as nx
 import matplotlib.pyplot as plt
 import json
+import hashlib
+import tempfile
+import shutil
+import mmap
 
 import node
 import edge
@@ -50,6 +56,57 @@ def euclidean (inode, jnode):
 
 
 
+def euclidean_matrix (nodes, n_nodes):
+    """
+    The matrix of euclidean distances between all the nodes, computed via
+    NumPy broadcasting. It gives exactly the same values of euclidean().
+
+    :param nodes: The nodes (i.e., sources, customers, and depot).
+    :param n_nodes: The number of nodes.
+    :return: The matrix of distances.
+    """
+    coords = np.zeros((n_nodes, 2))
+    for node in nodes:
+        coords[node.id] = node.x, node.y
+
+    dx = coords[:, 0, None] - coords[None, :, 0]
+    dy = coords[:, 1, None] - coords[None, :, 1]
+    dists = np.sqrt(dx * dx + dy * dy)
+
+    # NumPy rounds scaling by 10^3, while round() works on the exact decimal
+    # representation. They can only disagree when the scaled distance is close
+    # to a rounding tie, so these few distances are rounded as euclidean() does.
+    scaled = dists * 1000.0
+    ties = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    rounded = np.round(dists, 3)
+    rounded[ties] = [round(d, 3) for d in dists[ties].tolist()]
+    return rounded
+
+
+
+# The reference to a memory mapped file, used to pickle the arrays mapped on it
+_MappedArray = collections.namedtuple("_MappedArray", "filename offset shape dtype order")
+
+
+
+def _to_reference (value):
+    """ The reference to an array mapping a whole file (read-only), or the value itself. """
+    if isinstance(value, np.memmap) and isinstance(value.base, mmap.mmap) and value.mode == "r":
+        order = "F" if value.flags.f_contiguous and not value.flags.c_contiguous else "C"
+        return _MappedArray(value.filename, value.offset, value.shape, value.dtype.str, order)
+    return value
+
+
+
+def _from_reference (value):
+    """ The array mapped on the file of a reference (see _to_reference), or the value itself. """
+    if isinstance(value, _MappedArray):
+        return np.memmap(value.filename, dtype=value.dtype, mode="r", offset=value.offset,
+                         shape=value.shape, order=value.order)
+    return value
+
+
+
 class Problem:
     """
     An instance of this class represents a single-source Team Orienteering
@@ -60,7 +117,7 @@ class Problem:
 
     """
 
-    def __init__(self, name, n_nodes, n_vehicles, Tmax, sources, nodes, depot):
+    def __init__(self, name, n_nodes, n_vehicles, Tmax, sources, nodes, depot, *, dists=None):
         """
         Initialise.
 
@@ -71,10 +128,10 @@ class Problem:
         :param sources: The source nodes.
         :param nodes: The nodes to visit.
         :param depot: The depot.
+        :param dists: The matrix of distances between nodes. If not provided,
+                    the euclidean distance is used.
 
         :attr dists: The matrix of distances between nodes.
-        :attr positions: A dictionary of nodes positions.
-        :attr edges: The edges connecting the nodes.
         """
         self.name = name
         self.n_nodes = n_nodes
@@ -84,37 +141,36 @@ class Problem:
         self.nodes = nodes
         self.depot = depot
 
-        # Initialise edges list and nodes positions
-        edges = collections.deque()
-        dists = np.zeros((n_nodes, n_nodes))
-        # Calculate the matrix of distances and instantiate the edges
-        # and define nodes colors and positions
-        source_id = 0
-        for node1, node2 in itertools.permutations(itertools.chain(sources, nodes, (depot,)), 2):
-            # Calculate the edge cost
-            id1, id2 = node1.id, node2.id
-            cost = euclidean(node1, node2)
-            # Compile the oriented matrix of distances
-            dists[id1, id2] = cost
-
-            if node1.isdepot or node1.issource or node2.isdepot or node2.issource:
-                continue
-            # Create the edge
-            edges.append(edge.Edge(node1, node2, cost))
-
-        # Compute savings
-        for e in edges:
-            id1, id2 = e.inode.id, e.jnode.id
-            e.savings = { s.id : dists[s.id, id2] + dists[id1, depot.id] - e.cost for s in sources}
-
+        # Calculate the matrix of distances in a vectorized way
+        if dists is None:
+            dists = euclidean_matrix(self.iternodes(), n_nodes)
         self.dists = dists
-        self.edges = edges
 
 
     def __hash__(self):
         return id(self)
 
 
+    def __getstate__(self):
+        # The memory mapped arrays (e.g., of compiled instances) are pickled as references to
+        # their files, so that the processes receiving the problem (even if not forked) map
+        # the same files instead of receiving a copy of them
+        state = {}
+        for attr, value in self.__dict__.items():
+            if isinstance(value, edge.EdgeStore):
+                value = copy.copy(value)
+                value.__dict__.update((k, _to_reference(v)) for k, v in value.__dict__.items())
+            state[attr] = _to_reference(value)
+        return state
+
+
+    def __setstate__(self, state):
+        for attr, value in state.items():
+            if isinstance(value, edge.EdgeStore):
+                value.__dict__.update((k, _from_reference(v)) for k, v in value.__dict__.items())
+            setattr(self, attr, _from_reference(value))
+
+
     def __repr__(self):
         return f"""
         Problem {self.name}
@@ -132,11 +188,101 @@ class Problem:
         return len(self.sources) > 1
 
 
+    @functools.cached_property
+    def edges (self):
+        """ The edges connecting the nodes (see edge.EdgeStore). """
+        return edge.EdgeStore.build(self.nodes, self.dists, self.sources, self.depot)
+
+
+    @functools.cached_property
+    def savings_order (self):
+        """
+        For each source, the positions of all the edges sorted by decreasing savings.
+        It is computed once and reused by all the runs of the savings based heuristic,
+        which only need to filter it (the sort is stable, so ties keep the order
+        of the edges).
+        """
+        edges = self.edges
+        return tuple(np.argsort(-edges.source_savings(k), kind="stable") for k in range(len(self.sources)))
+
+
+    @functools.cached_property
+    def vehicle_preferences (self):
+        """
+        For each vehicle, the positions of the nodes to visit sorted by increasing
+        marginal distance (i.e., the distance source-node-depot of the vehicle minus
+        the smallest distance source-node-depot of the other vehicles).
+        It only depends on the problem, so it is computed once for all the mappings.
+        """
+        dists, depot = self.dists, self.depot
+        vehicles_sources = [s.id for s in self.sources for _ in s.vehicles]
+        ids = [n.id for n in self.nodes]
+
+        # Compute the absolute distances
+        abs_dists = (dists[np.ix_(vehicles_sources, ids)] + dists[ids, depot.id]).astype("float32")
+
+        # The smallest distance of the other vehicles is the smallest of all vehicles, unless
+        # the vehicle is the one with the smallest distance, in which case it is the second smallest
+        if len(abs_dists) > 1:
+            smallest = np.partition(abs_dists, 1, axis=0)
+            others = np.where(abs_dists == smallest[0], smallest[1], smallest[0])
+        else:
+            others = np.zeros_like(abs_dists)
+        return np.argsort(abs_dists - others, axis=1, kind="stable")
+
+
+    @functools.cached_property
+    def quantities (self):
+        """ The delivery quantity of each node (by id). """
+        qty = np.zeros(self.n_nodes, dtype=np.int64)
+        for node in self.iternodes():
+            qty[node.id] = node.qty
+        return qty
+
+
+    @functools.cached_property
+    def neighbours (self):
+        """
+        For each node (by id), the ids of the nodes to visit sorted by increasing distance
+        from it. Ties keep the order of the nodes to visit.
+        It is computed once and used by all the runs of the nearest neighbour heuristic.
+        """
+        ids = np.array([n.id for n in self.nodes])
+        order = np.argsort(self.dists[:, ids], axis=1, kind="stable")
+        return ids.astype(np.int32)[order]
+
+
     def iternodes (self):
         """ A method to iterate over all the nodes of the problem (i.e., sources, customers, depot)"""
         return itertools.chain(self.sources, self.nodes, (self.depot,))
 
 
+    # Data that only depend on nodes, fleet, and distances (see with_quantities)
+    SHARED = ("edges", "savings_order", "vehicle_preferences", "neighbours")
+
+
+    def with_quantities (self, name, quantities):
+        """
+        A problem with the same nodes, fleet, and distances, but different delivery
+        quantities (e.g., the same area in another period). The data that do not depend
+        on quantities (see SHARED) are computed once and shared by the two problems.
+
+        :param name: The name of the new problem.
+        :param quantities: The delivery quantity of each node (by id).
+        :return: The new problem.
+        """
+        def renew (n):
+            n = copy.copy(n)
+            n.qty = quantities[n.id]
+            return n
+
+        problem = Problem(name, self.n_nodes, self.n_vehicles, self.Tmax, tuple(renew(n) for n in self.sources),
+                          tuple(renew(n) for n in self.nodes), renew(self.depot), dists=self.dists)
+        for attr in Problem.SHARED:
+            setattr(problem, attr, getattr(self, attr))
+        return problem
+
+
 
 def plot (problem, *, routes=tuple(), mapping=None, figsize=(6,4), title=None):
     """
@@ -215,16 +361,187 @@ def export (problem, path):
 
 
 
-def read_real_problem (filename, path="../tests/casestudy/"):
+# Directory of the compiled instances (see read_benchmark and read_real_problem),
+# relative to the directory of the files they are read from
+CACHE = "../.cache/"
+
+# Version of the compiled instances, to change when their content changes
+CACHE_VERSION = 3
+
+
+
+def _digest (filenames):
+    """
+    The hash of the names and content of some files (and of the version of the
+    compiled instances). The names are part of it, since they name the problems.
+    """
+    digest = hashlib.sha256(f"compiled instance v{CACHE_VERSION}".encode())
+    for filename in filenames:
+        digest.update(os.path.basename(filename).encode() + b"\0")
+        with open(filename, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+
+def save_compiled (problem, directory, *, shared_dists=None):
+    """
+    This method saves a problem as a compiled instance --i.e., a directory of raw
+    .npy files with nodes, fleet, matrix of distances, edges (see edge.EdgeStore) and
+    sorted savings of each source, that can be loaded without parsing and computing anything.
+
+    :param problem: The problem.
+    :param directory: The directory.
+    :param shared_dists: The name of a .npy file with the matrix of distances in the
+                        parent directory (e.g., see read_dists), which is referred to instead of
+                        being copied, so that the instances using it share it.
+    """
+    os.makedirs(directory)
+    nodes = list(problem.iternodes())
+    kind = [1 if n.issource else 2 if n.isdepot else 0 for n in nodes]
+    capacities = [v.capacity for s in problem.sources for v in s.vehicles]
+    vehicle_source = [k for k, s in enumerate(problem.sources) for _ in s.vehicles]
+    arrays = {
+        "id": [n.id for n in nodes], "x": [n.x for n in nodes], "y": [n.y for n in nodes],
+        "qty": [n.qty for n in nodes], "kind": kind, "capacity": capacities, "vehicle_source": vehicle_source,
+        "savings_order": np.stack(problem.savings_order),
+        "edges_inode": problem.edges.inode, "edges_jnode": problem.edges.jnode,
+        "edges_cost": problem.edges.cost, "edges_savings": problem.edges.savings,
+    }
+    if shared_dists is None:
+        arrays["dists"] = problem.dists
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, name + ".npy"), np.asarray(array))
+    with open(os.path.join(directory, "problem.json"), "w") as file:
+        json.dump({"name": problem.name, "n_nodes": problem.n_nodes, "n_vehicles": problem.n_vehicles,
+                   "Tmax": problem.Tmax, "dists": shared_dists}, file)
+
+
+
+def load_compiled (directory):
+    """
+    This method loads a compiled instance (see save_compiled). The matrix of
+    distances, the edges, and the sorted savings are memory mapped read-only.
+
+    :param directory: The directory of the compiled instance.
+    :return: The problem instance.
+    """
+    def load (name, mmap_mode=None):
+        return np.load(os.path.join(directory, name + ".npy"), mmap_mode=mmap_mode)
+
+    with open(os.path.join(directory, "problem.json")) as file:
+        info = json.load(file)
+    ids, x, y, qty, kind = (load(name).tolist() for name in ("id", "x", "y", "qty", "kind"))
+    capacities, vehicle_source = load("capacity").tolist(), load("vehicle_source").tolist()
+
+    fleets = collections.defaultdict(list)
+    for vehicle_id, (capacity, k) in enumerate(zip(capacities, vehicle_source)):
+        fleets[k].append(vehicle.Vehicle(vehicle_id, capacity))
+
+    sources, nodes, depot = [], [], None
+    for i, x_, y_, q, k in zip(ids, x, y, qty, kind):
+        if k == 1:
+            sources.append(node.Node(i, x_, y_, q, issource=True, vehicles=tuple(fleets[len(sources)])))
+        elif k == 2:
+            depot = node.Node(i, x_, y_, q, isdepot=True)
+        else:
+            nodes.append(node.Node(i, x_, y_, q))
+
+    if info["dists"] is None:
+        dists = load("dists", mmap_mode="r")
+    else:
+        dists = np.load(os.path.join(os.path.dirname(os.path.normpath(directory)), info["dists"]), mmap_mode="r")
+
+    problem = Problem(info["name"], info["n_nodes"], info["n_vehicles"], info["Tmax"], tuple(sources),
+                      tuple(nodes), depot, dists=dists)
+    problem.edges = edge.EdgeStore(*(load("edges_" + name, mmap_mode="r") for name in ("inode", "jnode", "cost", "savings")))
+    problem.savings_order = load("savings_order", mmap_mode="r")
+    return problem
+
+
+
+def _compiled (read, filenames, cache):
+    """
+    This method returns the compiled instance of some files, compiling
+    it the first time by reading the files.
+
+    :param read: The function that reads the files.
+    :param filenames: The files the instance is read from.
+    :param cache: The directory of the compiled instances.
+    :return: The problem instance.
+    """
+    directory = os.path.join(cache, _digest(filenames))
+    if not os.path.exists(directory):
+        problem = read()
+        # A matrix of distances already in the cache is shared (see read_dists)
+        shared_dists = None
+        filename = getattr(problem.dists, "filename", None)
+        if filename is not None and os.path.isdir(cache) and os.path.samefile(os.path.dirname(filename), cache):
+            shared_dists = os.path.basename(filename)
+        # The instance is saved aside and then moved, so that other
+        # processes never see a partially written instance
+        os.makedirs(cache, exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=cache)
+        save_compiled(problem, os.path.join(tmp, "instance"), shared_dists=shared_dists)
+        try:
+            os.rename(os.path.join(tmp, "instance"), directory)
+        except OSError:
+            pass
+        shutil.rmtree(tmp, ignore_errors=True)
+    return load_compiled(directory)
+
+
+
+def read_dists (filename, *, cache=CACHE):
+    """
+    This method reads the matrix of road distances of the case study.
+
+    The json is converted once into a binary file in the cache, which is then
+    memory mapped read-only, so that all the months and all the processes share
+    the same copy of the matrix in memory.
+
+    :param filename: The json of distances.
+    :param cache: The directory of the binary file, relative to the one of the json
+                (None to read the json).
+    :return: The matrix of distances.
+    """
+    if cache is None:
+        with open(filename, "r") as file:
+            return np.asarray(json.load(file)["dists"])
+
+    cache = os.path.join(os.path.dirname(filename), cache)
+    npyfile = os.path.join(cache, f"dists-{_digest((filename,))}.npy")
+    if not os.path.exists(npyfile):
+        with open(filename, "r") as file:
+            dists = np.asarray(json.load(file)["dists"])
+        os.makedirs(cache, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=cache, suffix=".npy")
+        with os.fdopen(fd, "wb") as file:
+            np.save(file, dists)
+        os.replace(tmp, npyfile)
+    return np.load(npyfile, mmap_mode="r")
+
+
+
+def read_real_problem (filename, path="../tests/casestudy/", *, cache=CACHE):
     """
     This method is used to read a real case problem.
 
     :param filename: The file of delivery quantities to read.
     :param path: The directory where the file and the json of arcs are.
+    :param cache: The directory of the compiled instances, relative to path
+                (None to always parse the files).
     :retun: A instance of problem.
     """
-    problem = None 
+    if cache is None:
+        return _read_real_problem(filename, path, None)
+    return _compiled(lambda: _read_real_problem(filename, path, cache), (path + filename, path + "dists.json"), os.path.join(path, cache))
 
+
+
+def _read_real_problem (filename, path, cache):
+    """ Parse a real case problem (see read_real_problem). """
     with open(path + filename, 'r') as file:
 
         # Read problem parameters
@@ -260,48 +577,36 @@ def read_real_problem (filename, path="../tests/casestudy/"):
             nodes.append(node.Node(i, 0, 0, int(node_info[1])))
 
 
-        # Instantiate the problem
-        problem = Problem(filename, n_nodes, n_vehicles, Tmax, tuple(sources), tuple(nodes), depot)
-
-
     # Read the distances 
-    with open(path + "dists.json", "r") as file:
-        d = json.load(file)
-        problem.dists = np.asarray(d["dists"])
-
-
-       
-    # Instantiate edges
-    edges = collections.deque()
+    dists = read_dists(path + "dists.json", cache=cache)
 
-    for node1, node2 in itertools.permutations(itertools.chain(sources, nodes, (depot,)), 2):
-        if node1.isdepot or node1.issource or node2.isdepot or node2.issource:
-            continue
-        edges.append(edge.Edge(node1, node2, problem.dists[node1.id, node2.id] ))
+    # Instantiate the problem
+    return Problem(filename, n_nodes, n_vehicles, Tmax, tuple(sources), tuple(nodes), depot, dists=dists)
 
-    # Compute savings
-    for e in edges:
-        id1, id2 = e.inode.id, e.jnode.id
-        e.savings = { s.id : problem.dists[s.id, id2] + problem.dists[id1, depot.id] - e.cost for s in sources}
 
-    problem.edges = edges 
 
-    return problem     
 
 
 
-
-
-
-def read_benchmark (filename, path="../tests/benchmarks/"):
+def read_benchmark (filename, path="../tests/benchmarks/", *, cache=CACHE):
     """
     This method is used to read a benchmark problem created by
     changing the multi-source team orienteering benchmarks.
 
     :param filename: The name of the file to read.
     :param path: The path where the file is.
+    :param cache: The directory of the compiled instances, relative to path
+                (None to always parse the file).
     :return: The problem instance.
     """
+    if cache is None:
+        return _read_benchmark(filename, path)
+    return _compiled(lambda: _read_benchmark(filename, path), (path + filename,), os.path.join(path, cache))
+
+
+
+def _read_benchmark (filename, path):
+    """ Parse a benchmark problem (see read_benchmark). """
     with open(path + filename, 'r') as file:
         # Read problem parametersn_vehicles
         n_nodes = int(next(file).replace('\n','').replace(" ", "\t").split('\t')[1])
@@ -0,0 +1,207 @@
+"""
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+This file is part of the collaboration between University of Modena and
+University of Campania "Luigi Vanvitelli". It is authored by Mattia Neroni and Marta Rinaldi.
+
+The scope is the implementation and validation of several algorithms to optimise the
+collection of milk and its delivery to the production plant or cheese factory.
+
+The problem is new in literature, and can be partially associated to the multi-source
+vehicle routing problem, with the only difference that the starting and ending depots
+are different like in the multi-source team orienteering problem.
+For a better description of the problem, please refer to scientific pubblication.
+
+
+Author: Mattia Neroni, Ph.D., Eng.
+Contact: mneroni@unimore.it
+Date: January 2022
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+"""
+import random
+import time
+
+import numpy as np
+
+import interroute
+import opt
+from plan import Plan
+from route import Route
+
+
+
+def _ids (route):
+    """ The ids of the nodes of a route, including source and depot. """
+    return np.array([route.source.id, *(n.id for n in route.nodes), route.depot.id])
+
+
+
+def _cost (route, dists):
+    """ The length of a route. """
+    ids = _ids(route)
+    return dists[ids[:-1], ids[1:]].sum()
+
+
+
+def _total (routes):
+    """ The overall length of some routes, empty routes excluded (see plan.Plan.cost). """
+    return sum(r.cost for r in routes if r.nodes)
+
+
+
+def translate (problem, routes, key=lambda node: node.id):
+    """
+    This method translates the routes of a previous plan into routes made
+    by the nodes and vehicles of the problem. Farms that are not in the problem
+    anymore are dropped, and each vehicle without a route gets an empty one.
+
+    :param problem: The (updated) problem.
+    :param routes: The routes of the previous plan.
+    :param key: The function that identifies a node in both problems (e.g., its id,
+                if the nodes are the same, or its coordinates, if farms have been added or removed).
+    :return: The routes (sorted by vehicle, a vehicle might make more than one), and the farms not visited.
+    """
+    nodes = {key(n): n for n in problem.nodes}
+    vehicles = {v.id: (s, v) for s in problem.sources for v in s.vehicles}
+    visited = set()
+    translated = {vid: [] for vid in sorted(vehicles)}
+    for old in routes:
+        if old.vehicle.id not in vehicles:
+            continue
+        source, vehicle = vehicles[old.vehicle.id]
+        route = Route(source, problem.depot, vehicle)
+        for n in old.nodes:
+            n = nodes.get(key(n))
+            if n is not None and n.id not in visited:
+                route.nodes.append(n)
+                visited.add(n.id)
+        translated[vehicle.id].append(route)
+
+    result = []
+    for vid, vroutes in translated.items():
+        source, vehicle = vehicles[vid]
+        for route in vroutes or [Route(source, problem.depot, vehicle)]:
+            route.qty = sum(n.qty for n in route.nodes)
+            route.cost = _cost(route, problem.dists)
+            result.append(route)
+    return result, [n for n in problem.nodes if n.id not in visited]
+
+
+
+def repair (problem, routes):
+    """
+    This method makes the routes feasible, removing from the routes over capacity
+    or over Tmax the farm whose removal saves the most distance, until they are feasible.
+
+    :param problem: The problem.
+    :param routes: The routes (modified in place).
+    :return: The farms removed.
+    """
+    plan = Plan(problem, routes)
+    removed = []
+    for r, route in enumerate(routes):
+        while route.nodes and (route.qty > route.vehicle.capacity or route.cost > problem.Tmax):
+            node = route.nodes[int(np.argmax(plan.savings(r)))]
+            plan.remove(node)
+            removed.append(node)
+    return removed
+
+
+
+def insert (problem, routes, farms):
+    """
+    This method inserts some farms in the routes, each of them in the position
+    (of any route) where it adds the least distance without exceeding the capacity
+    of the vehicle and Tmax (see plan.Plan.insert). Farms with bigger quantities
+    are inserted first.
+
+    :param problem: The problem.
+    :param routes: The routes (modified in place, new routes are appended).
+    :param farms: The farms to insert.
+    :return: The farms that cannot be inserted anywhere.
+    """
+    plan = Plan(problem, routes)
+    return [farm for farm in sorted(farms, key=lambda n: -n.qty) if plan.insert(farm) is None]
+
+
+
+def ruin_and_recreate (problem, routes, *, maxtime=1.0, maxiter=100, share=0.1):
+    """
+    This method is a short local search that, at each iteration, removes some
+    random farms from the routes and inserts them again where they cost the
+    least (see insert). Only the routes changed are optimised again by the 2-OPT,
+    and the new routes are kept if they are better.
+
+    :param problem: The problem.
+    :param routes: The routes (modified in place).
+    :param maxtime: The maximum time the search can go on.
+    :param maxiter: The maximum number of iterations.
+    :param share: The share of the farms visited removed at each iteration.
+    :return: The routes and their overall cost (empty routes excluded).
+    """
+    # time control 
+    _start = time.time()
+
+    dists = problem.dists
+    routes = list(routes)
+    cost = _total(routes)
+    tours = {}
+    for _ in range(maxiter):
+        if time.time() - _start > maxtime:
+            break
+        visited = [(route, n) for route in routes for n in route.nodes]
+        if not visited:
+            break
+        backup = [(list(r.nodes), r.qty, r.cost) for r in routes]
+
+        # Remove some farms and insert them again
+        plan = Plan(problem, routes)
+        removed = random.sample(visited, max(1, round(len(visited) * share)))
+        touched = {id(route): route for route, _ in removed}
+        for _, n in removed:
+            plan.remove(n)
+        rejected = []
+        for n in sorted((n for _, n in removed), key=lambda n: -n.qty):
+            route = plan.insert(n)
+            if route is None:
+                rejected.append(n)
+            else:
+                touched[id(route)] = route
+
+        opt.allOPT2(list(touched.values()), dists, maxtime=maxtime, tours=tours)
+        new_cost = _total(routes)
+        if not rejected and new_cost < cost:
+            cost = new_cost
+        else:
+            del routes[len(backup):]
+            for route, (nodes, qty, rcost) in zip(routes, backup):
+                route.nodes.clear()
+                route.nodes.extend(nodes)
+                route.qty, route.cost = qty, rcost
+    return routes, cost
+
+
+
+def reoptimise (problem, routes, *, key=lambda node: node.id, maxtime=1.0):
+    """
+    This method re-optimises a previous plan after the quantities to deliver or
+    the farms to visit changed, instead of building a new plan from scratch.
+
+    The routes of the previous plan are translated to the updated problem, the
+    routes over capacity or Tmax are repaired, the farms not visited (i.e., new ones,
+    and the ones removed by the repair) are inserted where they cost the least, and
+    the plan is improved by a short local search (see interroute.improve and opt.allOPT2).
+
+    :param problem: The updated problem.
+    :param routes: The routes of the previous plan.
+    :param key: The function that identifies a node in both problems (see translate).
+    :param maxtime: The maximum time of each local search.
+    :return: The routes, their overall cost, and the farms that cannot be visited.
+    """
+    routes, unvisited = translate(problem, routes, key)
+    unvisited += repair(problem, routes)
+    rejected = insert(problem, routes, unvisited)
+
+    routes, _ = interroute.improve(problem, routes, maxtime=maxtime)
+    routes, _ = opt.allOPT2(routes, problem.dists, maxtime=maxtime)
+    routes, cost = ruin_and_recreate(problem, routes, maxtime=maxtime)
+    return tuple(r for r in routes if r.nodes), cost, tuple(rejected)
@@ -0,0 +1,80 @@
+"""
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+This file is part of the collaboration between University of Modena and
+University of Campania "Luigi Vanvitelli". It is authored by Mattia Neroni and Marta Rinaldi.
+
+The scope is the implementation and validation of several algorithms to optimise the
+collection of milk and its delivery to the production plant or cheese factory.
+
+The problem is new in literature, and can be partially associated to the multi-source
+vehicle routing problem, with the only difference that the starting and ending depots
+are different like in the multi-source team orienteering problem.
+For a better description of the problem, please refer to scientific pubblication.
+
+
+Author: Mattia Neroni, Ph.D., Eng.
+Contact: mneroni@unimore.it
+Date: January 2022
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+"""
+import os
+import sys
+import unittest
+import concurrent.futures
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import utils
+import pjs
+import nearest_neighbour
+
+
+BENCHMARKS = os.path.join(os.path.dirname(__file__), "benchmarks", "")
+
+
+
+def _solve (problem, seed):
+    """
+    A seeded solve with the biased randomisation (savings based heuristic
+    for even seeds, and nearest neighbour for odd ones).
+
+    :return: The ids of the nodes of each route, and the overall cost.
+    """
+    rng = np.random.default_rng(seed)
+    if seed % 2 == 0:
+        mapping = pjs.mapper(problem, bra=True, beta=0.2, rng=rng)
+        routes, cost = pjs.heuristic(problem, mapping, bra=True, beta=0.2, rng=rng)
+    else:
+        routes, cost = nearest_neighbour.heuristic(problem, bra=True, beta=0.2, rng=rng)
+    return [(r.vehicle.id, [n.id for n in r.nodes]) for r in routes], cost
+
+
+
+class TestConcurrentSolves(unittest.TestCase):
+    """
+    Solves running at the same time in threads on the same problem must give
+    the same solutions they give when run one after the other.
+    """
+    def test_seeded_bra_solves (self):
+        problem = utils.read_benchmark("p457_4.txt", BENCHMARKS, cache=None)
+        seeds = range(48)
+        expected = [_solve(problem, seed) for seed in seeds]
+        # Different seeds must give different solutions, or the test says nothing
+        self.assertGreater(len({cost for _, cost in expected}), 2)
+
+        # Switch threads as often as possible, so that solves interleave
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            with concurrent.futures.ThreadPoolExecutor(8) as pool:
+                solutions = list(pool.map(lambda seed: _solve(problem, seed), seeds))
+        finally:
+            sys.setswitchinterval(interval)
+        self.assertEqual(solutions, expected)
+
+
+
+if __name__ == '__main__':
+    unittest.main()